@@ -1,4 +1,4 @@
-from asyncio import get_event_loop, sleep as asleep, gather
+from asyncio import gather
 from traceback import format_exc
 
 from aiohttp import web
@@ -16,37 +16,31 @@ LOGGER.info(f"Media cache module loaded, enabled={media_cache.enabled}")
 
 import uvloop
 import asyncio
-uvloop.install()
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
 
 async def start_services():
     LOGGER.info(f'Initializing Surf-TG v-{__version__}')
-    await asleep(1.2)
     
     # Initialize Database Indexes
     from bot.helper.database import Database
     await Database().create_indexes()
     
-    await StreamBot.start()
+    # Telegram handshakes are independent, run them together
+    has_user = len(Telegram.SESSION_STRING) != 0
+    await gather(StreamBot.start(), *([UserBot.start()] if has_user else []))
     StreamBot.username = StreamBot.me.username
     LOGGER.info(f"Bot Client : [@{StreamBot.username}]")
-    if len(Telegram.SESSION_STRING) != 0:
-        await UserBot.start()
+    if has_user:
         UserBot.username = UserBot.me.username or UserBot.me.first_name or UserBot.me.id
         LOGGER.info(f"User Client : {UserBot.username}")
     
-    await asleep(1.2)
     LOGGER.info("Initializing Multi Clients")
     await initialize_clients()
     
-    await asleep(2)
     LOGGER.info('Initalizing Surf Web Server..')
     server = web.AppRunner(await web_server())
     LOGGER.info("Server CleanUp!")
     await server.cleanup()
     
-    await asleep(2)
     LOGGER.info("Server Setup Started !")
     
     await server.setup()
@@ -57,27 +51,47 @@ async def start_services():
     # Start cache cleanup background task
     LOGGER.info(f"Checking media cache status: enabled={media_cache.enabled}")
     if media_cache.enabled:
-        loop.create_task(cache_cleanup_task())
+        schedule_cache_cleanup()
+        media_cache.start_disk_scan()
         LOGGER.info(f"Media cache enabled: max {Telegram.CACHE_MAX_SIZE_GB}GB at {media_cache.cache_dir}")
     else:
         LOGGER.info("Media cache is disabled")
     
     # Start subtitle cache cleanup background task
-    loop.create_task(subtitle_cache.periodic_cleanup())
+    asyncio.create_task(subtitle_cache.periodic_cleanup())
     LOGGER.info("Subtitle cache cleanup task started")
     
-    await idle()
+    try:
+        await idle()
+    finally:
+        media_cache.stop_disk_scan()
+        await stop_clients()
+
+
+CACHE_CLEANUP_INTERVAL = 30 * 60  # 30 minutes
+_cleanup_task = None
+
 
+def schedule_cache_cleanup():
+    """Arm a loop timer for the next cache cleanup instead of parking a sleeping task."""
+    asyncio.get_running_loop().call_later(CACHE_CLEANUP_INTERVAL, _start_cache_cleanup)
 
-async def cache_cleanup_task():
-    """Background task to cleanup cache every 30 minutes."""
-    while True:
-        await asleep(30 * 60)  # 30 minutes
-        try:
-            result = await media_cache.cleanup()
-            LOGGER.info(f"Cache stats: {result['files_cached']} files, {result['cache_size_gb']:.2f}GB used")
-        except Exception as e:
-            LOGGER.error(f"Cache cleanup error: {e}")
+
+def _start_cache_cleanup():
+    global _cleanup_task
+    # Keep a reference so the running task is not garbage collected
+    _cleanup_task = asyncio.create_task(cache_cleanup_tick())
+
+
+async def cache_cleanup_tick():
+    """Run one cache cleanup, then schedule the next one."""
+    try:
+        result = await media_cache.cleanup()
+        LOGGER.info(f"Cache stats: {result['files_cached']} files, {result['cache_size_gb']:.2f}GB used")
+    except Exception as e:
+        LOGGER.error(f"Cache cleanup error: {e}")
+    finally:
+        schedule_cache_cleanup()
 
 async def stop_clients():
     await StreamBot.stop()
@@ -87,11 +101,8 @@ async def stop_clients():
 
 if __name__ == '__main__':
     try:
-        loop.run_until_complete(start_services())
+        uvloop.run(start_services())
     except KeyboardInterrupt:
         LOGGER.info('Service Stopping...')
     except Exception:
         LOGGER.error(format_exc())
-    finally:
-        loop.run_until_complete(stop_clients())
-        loop.stop()
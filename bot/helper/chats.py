@@ -1,22 +1,57 @@
-from asyncio import gather, create_task
+from asyncio import gather
+from html import escape
+from json import dumps
+from time import time
 from bot.helper.database import Database
 from bot.telegram import StreamBot
 from bot.config import Telegram
+from bot.helper.utils import group_posts_by_series, short_chat_id
+
+__all__ = ['clear_chat_cache', 'get_auth_channel_ids', 'get_chat_info', 'get_chats', 'posts_chat', 'post_playlist', 'posts_db_file']
 
 db = Database()
 
-async def get_chats():
+CHAT_CACHE_TTL = 60
+_chat_cache = {}
+# AUTH_CHANNEL parsed to ints, reparsed only when the stored value changes
+_auth_channel_ids = {'raw': None, 'ids': None}
+
+
+def clear_chat_cache():
+    _chat_cache.clear()
+
+
+async def get_chat_info(channel_id):
+    if (cached := _chat_cache.get(channel_id)) and (time() - cached['time'] < CHAT_CACHE_TTL):
+        return cached['value']
+    chat = await StreamBot.get_chat(channel_id)
+    info = {"chat-id": chat.id, "title": chat.title or chat.first_name, "type": chat.type.name}
+    _chat_cache[channel_id] = {'value': info, 'time': time()}
+    return info
+
+
+async def get_auth_channel_ids():
     AUTH_CHANNEL = await db.get_variable('auth_channel')
-    if AUTH_CHANNEL is None or AUTH_CHANNEL.strip() == '':
-        AUTH_CHANNEL = Telegram.AUTH_CHANNEL
-    else:
-        AUTH_CHANNEL = [channel.strip() for channel in AUTH_CHANNEL.split(",")]
-    
-    return [{"chat-id": chat.id, "title": chat.title or chat.first_name, "type": chat.type.name} for chat in await gather(*[create_task(StreamBot.get_chat(int(channel_id))) for channel_id in AUTH_CHANNEL])]
+    if AUTH_CHANNEL != _auth_channel_ids['raw'] or _auth_channel_ids['ids'] is None:
+        if AUTH_CHANNEL is None or AUTH_CHANNEL.strip() == '':
+            channels = Telegram.AUTH_CHANNEL
+        else:
+            channels = [channel.strip() for channel in AUTH_CHANNEL.split(",")]
+        _auth_channel_ids.update(raw=AUTH_CHANNEL, ids=[int(channel_id) for channel_id in channels])
+    return _auth_channel_ids['ids']
+
 
+async def get_chats():
+    return await gather(*(get_chat_info(channel_id) for channel_id in await get_auth_channel_ids()))
+
+
+def _js_args(*values):
+    """Arguments of an inline onclick call: JS string literals, then escaped for the attribute."""
+    return escape(', '.join(dumps(str(value)) for value in values))
 
-async def posts_chat(channels):
-    phtml = """
+
+def _chat_card(cid, img, title, ctype):
+    return f"""
     <div class="glass-panel text-center p-6 rounded-2xl hover:bg-white/5 transition-all duration-300 group relative overflow-hidden">
         <a href="/channel/{cid}" class="block">
              <div class="w-24 h-24 mx-auto mb-4 relative rounded-full p-1 bg-gradient-to-br from-primary to-purple-600 shadow-xl shadow-primary/20 group-hover:shadow-primary/40 transition-shadow">
@@ -29,13 +64,12 @@ async def posts_chat(channels):
         </a>
     </div>
 """
-    return ''.join(phtml.format(cid=str(channel["chat-id"]).replace("-100", ""), img=f"/api/thumb/{channel['chat-id']}", title=channel["title"], ctype=channel['type']) for channel in channels)
 
 
-async def post_playlist(playlists):
-    dhtml = """
+def _playlist_card(cid, img, title, edit_args):
+    return f"""
     <div class="glass-panel text-center p-6 rounded-2xl hover:bg-white/5 transition-all duration-300 group relative">
-        <a href="" onclick="openEditPopupForm(event, '{img}', '{ctype}', '{cid}', '{title}')"
+        <a href="" onclick="openEditPopupForm(event, {edit_args})"
             class="admin-only absolute top-3 right-3 p-2 rounded-lg bg-black/40 text-gray-400 hover:text-white hover:bg-primary z-10 transition-colors" 
             data-bs-toggle="modal" data-bs-target="#editFolderModal">
             <span class="material-symbols-outlined text-sm">edit</span>
@@ -54,25 +88,9 @@ async def post_playlist(playlists):
     </div>
     """
 
-    return ''.join(dhtml.format(cid=playlist["_id"], img=playlist["thumbnail"], title=playlist["name"], ctype=playlist['parent_folder']) for playlist in playlists)
-
 
-async def posts_db_file(posts):
-    import re
-    
-    from bot.helper.utils import group_posts_by_series
-    
-    grouped_posts = group_posts_by_series(posts, title_key='name')
-    
-    # Sorting (Optional: maintain original order or sort by name)
-    # The incoming 'posts' might already be sorted by date. We generally append new series at the end or keep flow.
-    # For DB file listing, preserving generic order or sorting by name might be best.
-    # Let's simple append for now to not break unexpected pagination orders too much, 
-    # but strictly speaking we're mixing non-parts and series.
-    # If we want to sort by Name:
-    # grouped_posts.sort(key=lambda x: x['name'])
-    
-    phtml = """
+def _file_card(chat_id, id, img, title, hash, size, edit_args, type_display, badge_color):
+    return f"""
     <div class="glass-panel rounded-xl overflow-hidden hover:shadow-xl hover:shadow-primary/10 transition-all duration-300 group relative">
         <a href="/watch/{chat_id}?id={id}&hash={hash}" class="block relative aspect-video bg-gray-900 overflow-hidden cursor-pointer">
              <img src="{img}" loading="lazy" class="w-full h-full object-cover transition-transform duration-700 group-hover:scale-105" alt="{title}">
@@ -92,7 +110,7 @@ async def posts_db_file(posts):
              </div>
 
             <a href=""
-                onclick="openPostEditPopupForm(event, '{img}', '{type}', '{size}', '{title}', '{cid}', '{ctype}')"
+                onclick="openPostEditPopupForm(event, {edit_args})"
                 class="admin-only absolute top-2 right-2 p-1.5 rounded bg-black/50 text-white hover:bg-primary transition-colors z-20" 
                 data-bs-toggle="modal" data-bs-target="#editModal">
                 <span class="material-symbols-outlined text-[16px]">edit</span>
@@ -112,26 +130,48 @@ async def posts_db_file(posts):
         </div>
     </div>
 """
-    html_output = ''
+
+
+def posts_chat(channels):
+    return ''.join([_chat_card(cid=short_chat_id(channel["chat-id"]), img=f"/api/thumb/{channel['chat-id']}", title=escape(channel["title"] or ''), ctype=channel['type']) for channel in channels])
+
+
+def post_playlist(playlists):
+    return ''.join([_playlist_card(cid=playlist["_id"], img=escape(playlist["thumbnail"]), title=escape(playlist["name"]),
+                                   edit_args=_js_args(playlist["thumbnail"], playlist['parent_folder'], playlist["_id"], playlist["name"]))
+                    for playlist in playlists])
+
+
+def posts_db_file(posts):
+    grouped_posts = group_posts_by_series(posts, title_key='name')
+    
+    # Sorting (Optional: maintain original order or sort by name)
+    # The incoming 'posts' might already be sorted by date. We generally append new series at the end or keep flow.
+    # For DB file listing, preserving generic order or sorting by name might be best.
+    # Let's simple append for now to not break unexpected pagination orders too much, 
+    # but strictly speaking we're mixing non-parts and series.
+    # If we want to sort by Name:
+    # grouped_posts.sort(key=lambda x: x['name'])
+    
+    parts = []
     for post in grouped_posts:
         if post.get('is_series'):
             type_display = f"SERIES ({post['parts_count']} Parts)"
             badge_color = "text-yellow-400 border-yellow-400/20 bg-yellow-400/10"
         else:
-            type_display = post.get('file_type', 'FILE')
+            type_display = escape(post['file_type'])
             badge_color = ""
             
-        html_output += phtml.format(
-            cid=post["_id"], 
-            chat_id=str(post["chat_id"]).replace("-100", ""), 
+        parts.append(_file_card(
+            chat_id=short_chat_id(post["chat_id"]), 
             id=post["file_id"], 
-            img=post["thumbnail"], 
-            title=post["name"], 
-            hash=post["hash"], 
-            size=post['size'], 
-            type=post['file_type'], 
-            ctype=post["parent_folder"],
+            img=escape(post["thumbnail"]), 
+            title=escape(post["name"]), 
+            hash=escape(post["hash"]), 
+            size=escape(post['size']), 
+            edit_args=_js_args(post["thumbnail"], post['file_type'], post['size'], post["name"],
+                               post["_id"], post["parent_folder"]),
             type_display=type_display,
             badge_color=badge_color
-        )
-    return html_output
+        ))
+    return ''.join(parts)
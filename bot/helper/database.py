@@ -1,9 +1,29 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import DESCENDING
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from bson import ObjectId
+from bot import LOGGER
 from bot.config import Telegram
+from bot.helper.utils import episode_fields
 import re
 import asyncio
+import time
+
+# Queries shorter than this keep using the regex scan, $text needs whole words
+MIN_TEXT_QUERY_LEN = 3
+
+# Connections opened by create_indexes() before serving requests
+POOL_WARM_CONNECTIONS = 10
+
+# Updates per bulk_write when backfilling episode fields on older files
+BACKFILL_BATCH = 1000
+
+# Fields actually rendered by the listing pages
+FOLDER_PROJECTION = {"name": 1, "thumbnail": 1, "parent_folder": 1}
+FILE_PROJECTION = {"name": 1, "thumbnail": 1, "file_id": 1, "hash": 1, "size": 1,
+                   "file_type": 1, "chat_id": 1, "parent_folder": 1}
+TGFILE_PROJECTION = {"msg_id": 1, "title": 1, "hash": 1, "size": 1, "type": 1, "chat_id": 1}
+
 
 class Database:
     _instance = None
@@ -18,42 +38,110 @@ class Database:
         if self._initialized:
             return
         
-        # Defer client creation to avoid event loop mixing
-        self._client = None
-        self._db = None
+        # Motor 3.x+ binds to the running loop on the first awaited operation,
+        # so building the client here does not mix event loops
+        self.mongo_client = AsyncIOMotorClient(
+            Telegram.DATABASE_URL,
+            maxPoolSize=50,
+            minPoolSize=POOL_WARM_CONNECTIONS,
+            maxIdleTimeMS=300_000,
+            serverSelectionTimeoutMS=5_000,
+        )
+        self.db = self.mongo_client["surftg"]
+        self.collection = self.db["playlist"]
+        self.config = self.db["config"]
+        self.files = self.db["files"]
+        self._config_cache = None
+        self._config_cache_ts = 0
+        self._backfill_task = None
         self._initialized = True
 
-    @property
-    def mongo_client(self):
-        if self._client is None:
-            MONGODB_URI = Telegram.DATABASE_URL
-            self._client = AsyncIOMotorClient(MONGODB_URI)
-            # Motor 3.x+ automatically uses the running loop when operations are awaited
-        return self._client
+    # Helper to ensure indexes are created (call this from __main__ or lazy check)
+    async def create_indexes(self):
+        # Create Indexes (independent, so issue them together)
+        await asyncio.gather(
+            self.files.create_index([("title", "text"), ("chat_id", 1)]),
+            self.collection.create_index([("name", "text"), ("parent_folder", 1)]),
+            self.collection.create_index([("parent_folder", 1), ("type", 1)]),
+            self._create_file_msg_index(),
+            self.files.create_index([("chat_id", 1), ("series_key", 1), ("episode_num", 1)]),
+        )
+        # Open a few pooled connections up front so the first page loads don't pay for them
+        await asyncio.gather(*(self.db.command('ping') for _ in range(POOL_WARM_CONNECTIONS)))
+        # Can walk the whole files collection once, so it runs alongside startup instead of before it
+        self._backfill_task = asyncio.create_task(self._backfill_episode_fields())
+        self._backfill_task.add_done_callback(self._backfill_done)
+
+    async def _create_file_msg_index(self):
+        # hash is a truncated file_unique_id shared by unrelated files, so a message is the unique key
+        try:
+            await self.files.drop_index("chat_id_1_hash_1")
+        except OperationFailure:
+            pass
+        try:
+            await self.files.create_index([("chat_id", 1), ("msg_id", 1)], unique=True)
+        except OperationFailure as e:
+            # Older databases may already hold duplicates from bulk indexing
+            LOGGER.warning(f"Could not create unique (chat_id, msg_id) index: {e}")
 
-    @property
-    def db(self):
-        if self._db is None:
-            self._db = self.mongo_client["surftg"]
-        return self._db
+    async def _backfill_episode_fields(self):
+        """Adds series_key/episode_num to files indexed before they were stored."""
+        ops = []
+        async for file in self.files.find({"series_key": {"$exists": False}}, {"title": 1}):
+            ops.append(UpdateOne({"_id": file["_id"]}, {"$set": episode_fields(file.get("title", ""))}))
+            if len(ops) >= BACKFILL_BATCH:
+                await self.files.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await self.files.bulk_write(ops, ordered=False)
 
-    @property
-    def collection(self):
-        return self.db["playlist"]
+    @staticmethod
+    def _backfill_done(task):
+        if not task.cancelled() and task.exception():
+            LOGGER.error(f"Episode fields backfill failed: {task.exception()}")
 
-    @property
-    def config(self):
-        return self.db["config"]
+    @staticmethod
+    async def _insert_many(collection, data):
+        """Unordered bulk insert that skips documents rejected as duplicates."""
+        try:
+            await collection.insert_many(data, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(err.get('code') != 11000 for err in errors):
+                raise
+            LOGGER.info(f"Skipped {len(errors)} duplicate documents in {collection.name}")
 
-    @property
-    def files(self):
-        return self.db["files"]
+    @staticmethod
+    def _search_query(field, query, sort_key, projection, text=True):
+        """Build (filter, projection, sort) for a name search, using the text index when possible."""
+        words = re.findall(r'\w+', query.lower())
+        if text and words and len(query.strip()) >= MIN_TEXT_QUERY_LEN:
+            # Quoted terms are ANDed by $text, matching the old all-words regex
+            search = ' '.join(f'"{word}"' for word in words)
+            return ({'$text': {'$search': search}},
+                    {**projection, 'score': {'$meta': 'textScore'}},
+                    [('score', {'$meta': 'textScore'}), (sort_key, DESCENDING)])
+        regex_pattern = '.*'.join(f'(?=.*{re.escape(word)})' for word in words)
+        regex_query = {'$regex': f'.*{regex_pattern}.*', '$options': 'i'}
+        return {field: regex_query}, projection, [(sort_key, DESCENDING)]
 
-    # Helper to ensure indexes are created (call this from __main__ or lazy check)
-    async def create_indexes(self):
-        # Create Indexes
-        await self.files.create_index([("title", "text"), ("chat_id", 1)])
-        await self.collection.create_index([("name", "text"), ("parent_folder", 1)])
+    async def _search(self, collection, base_query, field, query, sort_key, projection, page, per_page):
+        """
+        One page of a name search. $text only matches whole (stemmed) words, so a query it finds
+        nothing for, such as a partial word, falls back to the substring regex.
+        """
+        offset = (int(page) - 1) * per_page
+        for text in (True, False):
+            search_query, search_projection, sort = self._search_query(field, query, sort_key, projection, text)
+            query_filter = {**base_query, **search_query}
+            cursor = collection.find(query_filter, search_projection).sort(
+                sort).skip(offset).limit(per_page).batch_size(per_page)
+            docs = await cursor.to_list(length=per_page)
+            if docs or '$text' not in search_query:
+                return docs
+            # An empty later page of a query $text does match is just the end of its results
+            if offset and await collection.find_one(query_filter, {'_id': 1}):
+                return docs
 
 
     async def create_folder(self, parent_id, folder_name, thumbnail):
@@ -63,11 +151,8 @@ class Database:
 
     async def delete(self, document_id):
         try:
-            has_child_documents = await self.collection.count_documents(
-                {'parent_folder': document_id}) > 0
-            if has_child_documents:
-                await self.collection.delete_many(
-                    {'parent_folder': document_id})
+            # No-op when the folder has no children, so skip the count round-trip
+            await self.collection.delete_many({'parent_folder': document_id})
             result = await self.collection.delete_one({'_id': ObjectId(document_id)})
             return result.deleted_count > 0
         except Exception as e:
@@ -79,24 +164,20 @@ class Database:
             "$set": {"name": name, "thumbnail": thumbnail}})
         return result.modified_count > 0
 
-    async def search_DbFolder(self, query):
-        words = re.findall(r'\w+', query.lower())
-        regex_pattern = '.*'.join(f'(?=.*{re.escape(word)})' for word in words)
-        regex_query = {'$regex': f'.*{regex_pattern}.*', '$options': 'i'}
-        myquery = {'type': 'folder', 'name': regex_query}
-        cursor = self.collection.find(myquery).sort('_id', DESCENDING)
-        mydoc = await cursor.to_list(length=None)
+    async def search_DbFolder(self, query, page=1, per_page=50):
+        mydoc = await self._search(self.collection, {'type': 'folder'}, 'name', query, '_id', {'name': 1},
+                                   page, per_page)
         return [{'_id': str(x['_id']), 'name': x['name']} for x in mydoc]
 
     async def add_json(self, data):
         if data:
-            await self.collection.insert_many(data)
+            await self._insert_many(self.collection, data)
 
     async def get_Dbfolder(self, parent_id="root", page=1, per_page=50):
         query = {"parent_folder": parent_id, "type": "folder"} if parent_id != 'root' else {
             "parent_folder": 'root', "type": "folder"}
         
-        cursor = self.collection.find(query)
+        cursor = self.collection.find(query, FOLDER_PROJECTION)
         if parent_id != 'root':
             offset = (int(page) - 1) * per_page
             cursor = cursor.skip(offset).limit(per_page)
@@ -106,7 +187,7 @@ class Database:
     async def get_dbFiles(self, parent_id=None, page=1, per_page=50):
         query = {"parent_folder": parent_id, "type": "file"}
         offset = (int(page) - 1) * per_page
-        cursor = self.collection.find(query).sort(
+        cursor = self.collection.find(query, FILE_PROJECTION).sort(
             'file_id', DESCENDING).skip(offset).limit(per_page)
         return await cursor.to_list(length=per_page)
 
@@ -118,14 +199,8 @@ class Database:
             return None
 
     async def search_dbfiles(self, id, query, page=1, per_page=50):
-        words = re.findall(r'\w+', query.lower())
-        regex_pattern = '.*'.join(f'(?=.*{re.escape(word)})' for word in words)
-        regex_query = {'$regex': f'.*{regex_pattern}.*', '$options': 'i'}
-        query = {'type': 'file', 'parent_folder': id, 'name': regex_query}
-        offset = (int(page) - 1) * per_page
-        cursor = self.collection.find(query).sort(
-            'file_id', DESCENDING).skip(offset).limit(per_page)
-        return await cursor.to_list(length=per_page)
+        return await self._search(self.collection, {'type': 'file', 'parent_folder': id}, 'name', query,
+                                  'file_id', FILE_PROJECTION, page, per_page)
 
     async def update_config(self, theme, auth_channel):
         bot_id = Telegram.BOT_TOKEN.split(":", 1)[0]
@@ -133,44 +208,42 @@ class Database:
         if config is None:
             result = await self.config.insert_one(
                 {"_id": bot_id, "theme": theme, "auth_channel": auth_channel})
+            self._config_cache = None
             return result.inserted_id is not None
         else:
             result = await self.config.update_one({"_id": bot_id}, {
                 "$set": {"theme": theme, "auth_channel": auth_channel}})
+            self._config_cache = None
             return result.modified_count > 0
 
     async def get_variable(self, key):
-        bot_id = Telegram.BOT_TOKEN.split(":", 1)[0]
-        config = await self.config.find_one({"_id": bot_id})
-        return config.get(key) if config is not None else None
+        if self._config_cache is None or time.monotonic() - self._config_cache_ts >= 30:
+            bot_id = Telegram.BOT_TOKEN.split(":", 1)[0]
+            self._config_cache = await self.config.find_one({"_id": bot_id}) or {}
+            self._config_cache_ts = time.monotonic()
+        return self._config_cache.get(key)
 
     async def list_tgfiles(self, id, page=1, per_page=50):
         query = {'chat_id': id}
         offset = (int(page) - 1) * per_page
-        cursor = self.files.find(query).sort(
+        cursor = self.files.find(query, TGFILE_PROJECTION).sort(
             'msg_id', DESCENDING).skip(offset).limit(per_page)
         return await cursor.to_list(length=per_page)
 
     async def add_tgfiles(self, chat_id, file_id, hash, name, size, file_type):
-        if await self.files.find_one({"chat_id": chat_id, "hash": hash}):
-            return
-        file = {"chat_id": chat_id, "msg_id": file_id,
-                "hash": hash, "title": name, "size": size, "type": file_type}
-        await self.files.insert_one(file)
+        file = {"chat_id": chat_id, "msg_id": int(file_id),
+                "hash": hash, "title": name, "size": size, "type": file_type,
+                **episode_fields(name)}
+        await self.files.update_one(
+            {"chat_id": chat_id, "msg_id": file["msg_id"]}, {"$setOnInsert": file}, upsert=True)
 
     async def search_tgfiles(self, id, query, page=1, per_page=50):
-        words = re.findall(r'\w+', query.lower())
-        regex_pattern = '.*'.join(f'(?=.*{re.escape(word)})' for word in words)
-        regex_query = {'$regex': f'.*{regex_pattern}.*', '$options': 'i'}
-        query = {'chat_id': id, 'title': regex_query}
-        offset = (int(page) - 1) * per_page
-        cursor = self.files.find(query).sort(
-            'msg_id', DESCENDING).skip(offset).limit(per_page)
-        return await cursor.to_list(length=per_page)
+        return await self._search(self.files, {'chat_id': id}, 'title', query, 'msg_id', TGFILE_PROJECTION,
+                                  page, per_page)
     
     async def add_btgfiles(self, data):
         if data:
-            await self.files.insert_many(data)
+            await self._insert_many(self.files, [{**file, **episode_fields(file["title"])} for file in data])
 
     async def delete_file(self, chat_id, msg_id, hash):
         """Delete a file entry from the files collection."""
@@ -1,75 +1,144 @@
+from html import escape
 from os.path import splitext
-import re
+from bot import LOGGER
 from bot.config import Telegram
 from bot.helper.database import Database
 from bot.telegram import StreamBot, UserBot
 from bot.helper.file_size import get_readable_file_size
 from bot.helper.cache import get_cache, save_cache
-from asyncio import gather
+from bot.helper.utils import PART_RE, series_representative
+from asyncio import Semaphore, as_completed, gather, sleep
+from heapq import merge
+from itertools import islice
+from pyrogram.enums import MessagesFilter
+from pyrogram.errors import FloodWait
 
 db = Database()
 
+# Same replacement as re.sub(r'[.,|_\',]', ' ', title), one char for one space
+CLEAN_TABLE = str.maketrans(dict.fromkeys(".,|_'", ' '))
 
-async def fetch_message(chat_id, message_id):
-    try:
-        message = await StreamBot.get_messages(chat_id, message_id)
-        return message
-    except Exception as e:
-        return None
 
+# Telegram returns at most 200 messages per get_messages call
+MESSAGES_PER_REQUEST = 200
 
-async def get_messages(chat_id, first_message_id, last_message_id, batch_size=50):
+POSTS_PER_PAGE = 50
+
+# Only names with a dot this close to the end (".mkv", ".webm", ...) carry an extension worth splitting;
+# file_ids and most captions have none
+EXT_TAIL = 6
+
+
+async def fetch_messages(chat_id, message_ids, sem):
+    async with sem:
+        while True:
+            try:
+                return await StreamBot.get_messages(chat_id, message_ids)
+            except FloodWait as e:
+                # Keep the slot while waiting so the other batches back off too
+                LOGGER.info(f"Sleeping for {str(e.value)}s before fetching messages {message_ids[0]}-{message_ids[-1]}")
+                await sleep(e.value)
+            except Exception as e:
+                LOGGER.error(f"Failed to fetch messages {message_ids[0]}-{message_ids[-1]} of {chat_id}: {e}")
+                return []
+
+
+async def get_messages(chat_id, first_message_id, last_message_id, concurrency=4):
     messages = []
-    current_message_id = first_message_id
-    while current_message_id <= last_message_id:
-        batch_message_ids = list(range(current_message_id, min(current_message_id + batch_size, last_message_id + 1)))
-        tasks = [fetch_message(chat_id, message_id) for message_id in batch_message_ids]
-        batch_messages = await gather(*tasks)
-        for message in batch_messages:
-            if message:
+    chat_id_str = str(chat_id)
+    sem = Semaphore(concurrency)
+    tasks = [fetch_messages(chat_id, list(range(start, min(start + MESSAGES_PER_REQUEST, last_message_id + 1))), sem)
+             for start in range(first_message_id, last_message_id + 1, MESSAGES_PER_REQUEST)]
+    for task in as_completed(tasks):
+        for message in await task:
+            if message and not message.empty:
                 if file := message.video or message.document:
                     title = file.file_name or message.caption or file.file_id
-                    title, _ = splitext(title)
-                    title = re.sub(r'[.,|_\',]', ' ', title)
+                    if '.' in title[-EXT_TAIL:]:
+                        title, _ = splitext(title)
+                    title = title.translate(CLEAN_TABLE)
                     messages.append({"msg_id": message.id, "title": title,
                                      "hash": file.file_unique_id[:6], "size": get_readable_file_size(file.file_size),
-                                     "type": file.mime_type, "chat_id": str(chat_id)})
-        current_message_id += batch_size
+                                     "type": file.mime_type, "chat_id": chat_id_str})
     return messages
 
 
-async def get_files(chat_id, page=1):
+async def search_files(chat_id, filter, offset, limit):
+    return [message async for message in UserBot.search_messages(chat_id, filter=filter, offset=offset, limit=limit)]
+
+
+async def get_file_posts(chat_id, page, cursor=None):
+    """
+    Newest-first video/document posts of a page, filtered by Telegram instead of walking the whole history.
+    cursor is how many videos and documents the pages before it used; returns (posts, cursor of the next page).
+    """
+    if cursor:
+        # Both searches resume where the previous page stopped, so a page costs the same at any depth
+        skip, (videos_seen, documents_seen) = 0, cursor
+    else:
+        # Each search is newest first, so the first offset+50 of both cover the page once merged
+        skip, videos_seen, documents_seen = (int(page) - 1) * POSTS_PER_PAGE, 0, 0
+    videos, documents = await gather(
+        search_files(chat_id, MessagesFilter.VIDEO, videos_seen, skip + POSTS_PER_PAGE),
+        search_files(chat_id, MessagesFilter.DOCUMENT, documents_seen, skip + POSTS_PER_PAGE))
+    # Tagged so the cursor knows which search each merged post came from
+    merged = merge(((post.id, True, post) for post in videos),
+                   ((post.id, False, post) for post in documents), reverse=True)
+    taken = list(islice(merged, skip + POSTS_PER_PAGE))
+    used_videos = sum(is_video for _, is_video, _ in taken)
+    cursor = [videos_seen + used_videos, documents_seen + len(taken) - used_videos]
+    return [post for _, _, post in taken[skip:]], cursor
+
+
+async def get_files(chat_id, page=1, as_html=False):
     if Telegram.SESSION_STRING == '':
-        return await db.list_tgfiles(id=chat_id, page=page)
+        posts = await db.list_tgfiles(id=chat_id, page=page)
+        return await render_posts(posts, chat_id) if as_html else posts
     if cache := get_cache(chat_id, int(page)):
-        return cache
+        if not as_html:
+            return cache["posts"]
+        # Pages cached before the html was stored are rendered as before
+        return cache.get("html") or await render_posts(cache["posts"], chat_id)
     
-    raw_posts = []
-    async for post in UserBot.get_chat_history(chat_id=int(chat_id), limit=50, offset=(int(page) - 1) * 50):
+    prev = get_cache(chat_id, int(page) - 1) if int(page) > 1 else None
+    posts, cursor = await get_file_posts(int(chat_id), page, prev and prev.get("cursor"))
+    grouped_posts = []
+    series_map = {}
+    chat_id_str = str(chat_id)
+    for post in posts:
         file = post.video or post.document
         if not file:
             continue
         title = file.file_name or post.caption or file.file_id
-        title, _ = splitext(title)
-        title = re.sub(r'[.,|_\',]', ' ', title)
-        raw_posts.append({"msg_id": post.id, "title": title,
-                    "hash": file.file_unique_id[:6], "size": get_readable_file_size(file.file_size), 
-                    "type": file.mime_type, "chat_id": str(chat_id)})
-    
-    from bot.helper.utils import group_posts_by_series
-    
-    grouped_posts = group_posts_by_series(raw_posts, title_key='title')
+        if '.' in title[-EXT_TAIL:]:
+            title, _ = splitext(title)
+        title = title.translate(CLEAN_TABLE)
+        entry = {"msg_id": post.id, "title": title,
+                 "hash": file.file_unique_id[:6], "size": get_readable_file_size(file.file_size), 
+                 "type": file.mime_type, "chat_id": chat_id_str}
+        # Group series parts while reading the posts instead of in a second pass
+        match = PART_RE.match(title) if 'part' in title.lower() else None
+        if match:
+            entry['part_number'] = int(match.group(2))
+            series_name = match.group(1).strip()
+            if (series := series_map.get(series_name)) is None:
+                # Posts are newest first, so the series keeps the slot of its latest part
+                series = series_map[series_name] = (len(grouped_posts), [])
+                grouped_posts.append(None)
+            series[1].append(entry)
+        else:
+            grouped_posts.append(entry)
     
-    # Sort final list by message ID (descending usually, or maintain original flow)
-    # The original list was by chat_history (latest first), so we should preserve that somewhat?
-    # For now, let's sort by msg_id descending to match typical telegram order
-    grouped_posts.sort(key=lambda x: x['msg_id'], reverse=True)
+    # Slots are already in chat order (latest first), no sort needed
+    for series_name, (index, parts) in series_map.items():
+        grouped_posts[index] = series_representative(series_name, parts, title_key='title')
 
-    save_cache(chat_id, {"posts": grouped_posts}, page)
-    return grouped_posts
+    html = await render_posts(grouped_posts, chat_id)
+    save_cache(chat_id, {"html": html, "posts": grouped_posts, "cursor": cursor}, page)
+    return html if as_html else grouped_posts
 
-async def posts_file(posts, chat_id):
-    phtml = """
+def _file_card(chat_id, id, img, title, hash, size, type, type_display, badge_color):
+    return f"""
     <div class="glass-panel rounded-xl overflow-hidden hover:shadow-xl hover:shadow-primary/10 transition-all duration-300 group relative">
         <a href="/watch/{chat_id}?id={id}&hash={hash}" class="block relative aspect-video bg-gray-900 overflow-hidden cursor-pointer">
              <img src="{img}" loading="lazy" class="w-full h-full object-cover transition-transform duration-700 group-hover:scale-105" alt="{title}">
@@ -107,26 +176,34 @@ async def posts_file(posts, chat_id):
         </div>
     </div>
 """
-    html_output = ''
+
+
+async def posts_file(posts, chat_id):
+    cid = str(chat_id).replace("-100", "")
+    thumb_base = f"/api/thumb/{chat_id}?id="
     for post in posts:
+        msg_id = post['msg_id']
+        mtype = escape(post['type'] or '')
         # Determine badge text and color
         if post.get('is_series'):
             type_display = f"SERIES ({post['parts_count']} Parts)"
             badge_color = "text-yellow-400 border-yellow-400/20 bg-yellow-400/10"
         else:
-            type_display = post.get('type', 'FILE')
+            type_display = mtype
             badge_color = ""
             
-        html_output += phtml.format(
-            chat_id=str(chat_id).replace("-100", ""), 
-            id=post["msg_id"], 
-            img=f"/api/thumb/{chat_id}?id={post['msg_id']}", 
-            title=post["title"], 
-            hash=post["hash"], 
-            size=post['size'], 
-            type=post['type'],
+        yield _file_card(
+            chat_id=cid, 
+            id=msg_id, 
+            img=thumb_base + str(msg_id), 
+            title=escape(post['title']), 
+            hash=escape(post['hash']), 
+            size=escape(post['size']), 
+            type=mtype,
             type_display=type_display,
             badge_color=badge_color
         )
-        
-    return html_output
+
+
+async def render_posts(posts, chat_id):
+    return ''.join([card async for card in posts_file(posts, chat_id)])
@@ -7,12 +7,20 @@ import asyncio
 import hashlib
 import logging
 import os
+import re
 import shutil
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, Set
+from typing import Optional, Dict, Any, List, Set
 
-from pymongo import MongoClient, ASCENDING
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from bot.config import Telegram
 
 # Supported media types for caching
@@ -28,6 +36,110 @@ CACHEABLE_MIMETYPES = {
     'audio/ogg', 'audio/aac'
 }
 
+ALL_CACHEABLE_EXTENSIONS = frozenset(ext for exts in CACHEABLE_EXTENSIONS.values() for ext in exts)
+
+# Cache file extension for media without a file name
+MIME_EXTENSIONS = {
+    'video/mp4': '.mp4', 'video/x-matroska': '.mkv',
+    'video/webm': '.webm', 'audio/mpeg': '.mp3',
+    'audio/mp4': '.m4a', 'audio/flac': '.flac'
+}
+
+# The only fields get_cached_path reads
+LOOKUP_PROJECTION = {"_id": 0, "file_path": 1, "file_size": 1}
+
+# Sums file_size over the whole collection
+CACHE_SIZE_PIPELINE = [{"$group": {"_id": None, "total": {"$sum": "$file_size"}}}]
+
+# Only indexed fields and no _id, so the eviction query is covered by its index
+EVICTION_PROJECTION = {"_id": 0, "score": 1, "file_size": 1, "file_path": 1, "cache_key": 1, "file_name": 1}
+
+# Downloaded chunks handed to the disk in one pwritev() call
+WRITE_BATCH_CHUNKS = 16
+
+# Part ranges of one file fetched from Telegram at the same time
+DOWNLOAD_CONCURRENCY = 4
+
+
+def _write_chunks(fd: int, chunks: List[bytes], offset: int) -> None:
+    """Write chunks to fd at offset, one pwritev() per batch where the platform has it."""
+    chunks = [memoryview(chunk) for chunk in chunks]
+    while chunks:
+        written = os.pwritev(fd, chunks, offset) if hasattr(os, 'pwritev') else os.pwrite(fd, chunks[0], offset)
+        offset += written
+        # Drop what was written, keeping the tail of a partially written chunk
+        while chunks and written >= len(chunks[0]):
+            written -= len(chunks[0])
+            chunks.pop(0)
+        if written:
+            chunks[0] = chunks[0][written:]
+
+
+@lru_cache(maxsize=4096)
+def cache_key_for(chat_id: int, msg_id: int, secure_hash: str) -> str:
+    """Unique cache key for a media file (memoized: every range request recomputes it)."""
+    return f"{chat_id}:{msg_id}:{secure_hash}"
+
+
+@lru_cache(maxsize=4096)
+def cache_filename_for(cache_key: str, extension: str) -> str:
+    """Safe on-disk filename for a cache key (memoized to skip re-hashing)."""
+    # Opaque name, not a security boundary: BLAKE2b is faster than MD5 at the same width
+    hash_name = hashlib.blake2b(cache_key.encode(), digest_size=16).hexdigest()
+    return f"{hash_name}{extension}"
+
+
+async def _fd_op(loop, func, *args):
+    """Run a blocking call on an fd in the executor; if cancelled, let it finish so the fd isn't closed under it."""
+    future = loop.run_in_executor(None, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve a file's full size up front so multi-GB writes land in contiguous extents."""
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # No fallocate on this platform/filesystem: at least set the final size once
+        os.ftruncate(fd, size)
+
+
+def _remove_file(path) -> None:
+    """Unlink a file, ignoring one that is already gone."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+# get_cached_path results are reused for this many seconds, for up to PATH_CACHE_SIZE
+# keys (least recently used dropped first)
+PATH_CACHE_TTL = 5
+PATH_CACHE_SIZE = 10000
+
+# Download claims in Mongo expire after this many seconds (a worker died mid-download)
+DOWNLOAD_CLAIM_TTL = 3600
+
+# record_access batches the accesses of this many seconds into one bulk_write
+ACCESS_FLUSH_DELAY = 1
+
+# Seconds between rescans of the cache directory listing
+DISK_SCAN_INTERVAL = 30
+
+# Written cache data is flushed and dropped from the page cache every this many bytes
+DROP_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def _drop_page_cache(fd: int, offset: int = 0, length: int = 0) -> None:
+    """Flush a written range to disk and drop it from the page cache (length 0 = to the end)."""
+    getattr(os, 'fdatasync', os.fsync)(fd)
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
 
 class MediaCache:
     """
@@ -39,14 +151,26 @@ class MediaCache:
     
     K_FACTOR = 10  # Weight for access frequency
     RECENCY_DECAY_HOURS = 24  # Hours before recency bonus decays
+    HIGH_WATERMARK = 0.95  # Fill ratio that triggers eviction
+    LOW_WATERMARK = 0.85  # Fill ratio eviction frees down to
     
     def __init__(self):
         self.enabled = False
         self.cache_dir = None
         self.max_size_bytes = 0
         self.collection = None
+        self.claims = None
+        self._current_size_bytes = 0  # Sum of file_size over the collection
+        self._path_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()  # cache_key -> {'value': Path or None, 'time': ...}
+        self._disk_files: set = set()  # Names of the files in cache_dir, so lookups skip stat()
+        self._disk_free: Optional[int] = None  # Free bytes on the cache disk, as of the last scan/admission
         self.downloading: Set[str] = set()  # Track files being downloaded
         self._download_lock = asyncio.Lock()  # Lock for atomic check-and-add
+        self._evict_lock = asyncio.Lock()  # One eviction pass at a time
+        self._score_fn = self._make_score_fn()
+        self._pending_access: Dict[str, List[int]] = {}  # cache_key -> [chat_id, accesses not yet written]
+        self._flush_task: Optional[asyncio.Task] = None
+        self._scan_task: Optional[asyncio.Task] = None
         
         try:
             if not Telegram.CACHE_ENABLED:
@@ -55,18 +179,40 @@ class MediaCache:
             
             self.cache_dir = Path(Telegram.CACHE_DIR)
             self.max_size_bytes = Telegram.CACHE_MAX_SIZE_GB * 1024 * 1024 * 1024
+            self._high_watermark = int(self.max_size_bytes * self.HIGH_WATERMARK)
+            self._low_watermark = int(self.max_size_bytes * self.LOW_WATERMARK)
             
-            # MongoDB connection
-            self.mongo_client = MongoClient(Telegram.DATABASE_URL)
+            # MongoDB connection (async, so lookups don't stall the event loop)
+            self.mongo_client = AsyncIOMotorClient(Telegram.DATABASE_URL)
             self.db = self.mongo_client["surftg"]
             self.collection = self.db["media_cache"]
+            # One document per file being downloaded, shared by every worker on the database
+            self.claims = self.db["media_downloading"]
+            # Read-only view for the stream hot path: documents stay raw BSON until a field is read
+            self._raw_collection = self.collection.with_options(
+                codec_options=CodecOptions(document_class=RawBSONDocument)
+            )
             
-            # Create indexes
-            self.collection.create_index("cache_key", unique=True)
-            self.collection.create_index([("score", ASCENDING)])
+            # Create indexes and seed the size counter once, synchronously, at import time
+            with MongoClient(Telegram.DATABASE_URL) as setup_client:
+                setup_collection = setup_client["surftg"]["media_cache"]
+                setup_collection.create_index("cache_key", unique=True)
+                setup_collection.create_index([("score", ASCENDING)])
+                # Covers the eviction scan in _ensure_space (sort + projection served from the index)
+                setup_collection.create_index([
+                    ("score", ASCENDING), ("file_size", ASCENDING), ("file_path", ASCENDING),
+                    ("cache_key", ASCENDING), ("file_name", ASCENDING)
+                ])
+                setup_claims = setup_client["surftg"]["media_downloading"]
+                setup_claims.create_index("cache_key", unique=True)
+                setup_claims.create_index("started_at", expireAfterSeconds=DOWNLOAD_CLAIM_TTL)
+                result = list(setup_collection.aggregate(CACHE_SIZE_PIPELINE))
+                self._current_size_bytes = result[0]["total"] if result else 0
             
             # Ensure cache directory exists
             self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_files = self._scan_disk_files()
+            self._disk_free = self._read_disk_free()
             
             self.enabled = True
             logging.info(f"Media cache initialized: {self.cache_dir} (max: {Telegram.CACHE_MAX_SIZE_GB}GB)")
@@ -92,7 +238,10 @@ class MediaCache:
         tg_connect,
         client_index: int
     ) -> None:
-        """Start background download using separate client."""
+        """
+        Start background download using separate client.
+        Does nothing if this or another worker is already downloading the file.
+        """
         if not self.enabled:
             return
         
@@ -105,24 +254,43 @@ class MediaCache:
                 logging.debug(f"Already downloading: {file_name}")
                 return
             
-            if self.is_cached(chat_id, msg_id, secure_hash):
+            if await self.is_cached(chat_id, msg_id, secure_hash):
                 logging.debug(f"Already cached: {file_name}")
                 return
             
             if not self._is_cacheable(mime_type, file_name):
                 return
             
+            # The unique index makes the insert an atomic check-and-add across workers
+            try:
+                await self.claims.insert_one({"cache_key": cache_key, "started_at": datetime.now(timezone.utc)})
+            except DuplicateKeyError:
+                logging.debug(f"Already downloading in another worker: {file_name}")
+                return
+            
             # Mark as downloading INSIDE the lock
             self.downloading.add(cache_key)
         
         logging.info(f"Starting background download: {file_name} ({file_size / 1024 / 1024:.1f}MB)")
         
         # Start async download task
-        asyncio.create_task(self._download_file(
+        asyncio.create_task(self._download_in_flight(
             cache_key, chat_id, msg_id, secure_hash, file_id, 
             file_size, mime_type, file_name, tg_connect, client_index
         ))
     
+    async def _download_in_flight(self, cache_key: str, *args) -> None:
+        """Run a download and release its in-flight marks, however it ends."""
+        try:
+            await self._download_file(cache_key, *args)
+        finally:
+            self.downloading.discard(cache_key)
+            try:
+                await self.claims.delete_one({"cache_key": cache_key})
+            except Exception as e:
+                # Left to the TTL index
+                logging.error(f"Failed to release download claim {cache_key}: {e}")
+    
     async def _download_file(
         self,
         cache_key: str,
@@ -145,14 +313,12 @@ class MediaCache:
         if file_name:
             ext = Path(file_name).suffix.lower()
         else:
-            ext_map = {
-                'video/mp4': '.mp4', 'video/x-matroska': '.mkv',
-                'video/webm': '.webm', 'audio/mpeg': '.mp3',
-            }
-            ext = ext_map.get(mime_type, '.bin')
+            ext = MIME_EXTENSIONS.get(mime_type, '.bin')
         
         filename = self._generate_filename(cache_key, ext)
         file_path = self.cache_dir / filename
+        # Filesystem calls go through the executor so they don't stall the event loop
+        loop = asyncio.get_running_loop()
         
         # Retry loop for client rotation
         max_retries = len(multi_clients)
@@ -181,62 +347,46 @@ class MediaCache:
                 
                 # Download full file
                 chunk_size = 1024 * 1024  # 1MB chunks
-                offset = 0
-                total_written = 0
-                last_logged_percent = 0
+                part_total = (file_size + chunk_size - 1) // chunk_size
+                parts_per_range = max(1, -(-part_total // DOWNLOAD_CONCURRENCY))
+                progress = {'written': 0, 'logged': 0}
                 
-                with open(file_path, 'wb') as f:
-                    async for chunk in current_tg_connect.yield_file(
-                        fresh_file_id, current_client_index, offset, 0, file_size % chunk_size or chunk_size,
-                        (file_size + chunk_size - 1) // chunk_size, chunk_size
-                    ):
-                        if chunk:
-                            f.write(chunk)
-                            total_written += len(chunk)
-                            
-                            # Log progress every 10%
-                            if file_size > 0:
-                                current_percent = int((total_written / file_size) * 100)
-                                if current_percent >= last_logged_percent + 10 or current_percent == 100:
-                                    logging.info(f"Downloading [{file_name}]: {current_percent}% ({total_written / 1024 / 1024:.1f}MB / {file_size / 1024 / 1024:.1f}MB)")
-                                    last_logged_percent = current_percent
-                
-                # Verify file size
-                if file_path.exists():
-                    actual_size = file_path.stat().st_size
-                else:
-                    actual_size = total_written
+                fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    if file_size > 0:
+                        await _fd_op(loop, _preallocate, fd, file_size)
+                    # Telegram latency, not bandwidth, bounds a single stream: fetch a few
+                    # part ranges at once, each writing at its own offset
+                    tasks = [
+                        asyncio.create_task(self._fetch_range(
+                            current_tg_connect, fresh_file_id, current_client_index, fd, first_part,
+                            min(parts_per_range, part_total - first_part), chunk_size, file_size, file_name, progress
+                        ))
+                        for first_part in range(0, part_total, parts_per_range)
+                    ]
+                    try:
+                        await asyncio.gather(*tasks)
+                    except BaseException:
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                        raise
+                    await _fd_op(loop, _drop_page_cache, fd)
+                finally:
+                    os.close(fd)
+                # Verify file size: the file was preallocated to file_size, so only the
+                # byte count of the writes (fdatasync'ed above) says how much arrived
+                actual_size = progress['written']
                 
-                if actual_size >= file_size * 0.99:
+                if actual_size == file_size:
                     # Success! Save metadata and break loop
-                    now = datetime.utcnow()
-                    score = self._calculate_score(1, now)
-                    
-                    self.collection.update_one(
-                        {"cache_key": cache_key},
-                        {
-                            "$set": {
-                                "cache_key": cache_key,
-                                "file_path": str(file_path),
-                                "file_size": actual_size,
-                                "mime_type": mime_type,
-                                "file_name": file_name,
-                                "access_count": 1,
-                                "last_access": now,
-                                "created_at": now,
-                                "score": score
-                            }
-                        },
-                        upsert=True
-                    )
+                    await self._save_entry(cache_key, file_path, actual_size, mime_type, file_name)
                     logging.info(f"Background download complete: {file_name} ({actual_size / 1024 / 1024:.1f}MB)")
-                    self.downloading.discard(cache_key)
                     return # Exit function on success
 
                 else:
                     logging.warning(f"Incomplete download: {file_name} ({actual_size}/{file_size})")
-                    if file_path.exists():
-                        file_path.unlink()
+                    await loop.run_in_executor(None, _remove_file, file_path)
                         
                 # If we get here, other exceptions are caught below
                 
@@ -245,11 +395,10 @@ class MediaCache:
                 logging.error(f"Download attempt failed (Client {current_client_index}): {e}")
                 
                  # Explicit cleanup on failure
-                if file_path.exists():
-                     try:
-                        file_path.unlink()
-                     except OSError:
-                        pass
+                try:
+                    await loop.run_in_executor(None, _remove_file, file_path)
+                except OSError:
+                    pass
 
                 if "FLOOD_WAIT" in err_str or "flood" in err_str.lower():
                     logging.warning(f"FloodWait on Client {current_client_index}. Switching...")
@@ -274,100 +423,195 @@ class MediaCache:
 
         # If loop finishes without return, we failed
         logging.error(f"All download attempts failed for {file_name}")
-        self.downloading.discard(cache_key)
 
+    async def _fetch_range(
+        self,
+        tg_connect,
+        file_id,
+        client_index: int,
+        fd: int,
+        first_part: int,
+        part_count: int,
+        chunk_size: int,
+        file_size: int,
+        file_name: str,
+        progress: Dict[str, int]
+    ) -> None:
+        """Download parts [first_part, first_part + part_count) of a file and write them in place."""
+        loop = asyncio.get_running_loop()
+        start = position = dropped = first_part * chunk_size
+        end = min((first_part + part_count) * chunk_size, file_size)
+        batch = []
+        batch_bytes = 0
+        pending = None  # Write of the previous batch, still running in the executor
+        
+        try:
+            async for chunk in tg_connect.yield_file(
+                file_id, client_index, start, 0, end - (first_part + part_count - 1) * chunk_size,
+                part_count, chunk_size
+            ):
+                if not chunk:
+                    continue
+                batch.append(chunk)
+                batch_bytes += len(chunk)
+                if len(batch) >= WRITE_BATCH_CHUNKS:
+                    # Chunks are written in batches off the event loop, overlapping the download
+                    # of the next batch; one write in flight bounds the buffered data per range
+                    if pending is not None:
+                        await asyncio.shield(pending)
+                    flushed = position
+                    pending = loop.run_in_executor(None, _write_chunks, fd, batch, position)
+                    position += batch_bytes
+                    batch = []
+                    batch_bytes = 0
+                    # Keep multi-GB downloads from evicting the pages of files being streamed
+                    if flushed - dropped >= DROP_CACHE_BYTES:
+                        await _fd_op(loop, _drop_page_cache, fd, dropped, flushed - dropped)
+                        dropped = flushed
+                
+                # Log progress every 10%
+                progress['written'] += len(chunk)
+                if file_size > 0:
+                    current_percent = int((progress['written'] / file_size) * 100)
+                    if current_percent >= progress['logged'] + 10 or current_percent == 100:
+                        logging.info(f"Downloading [{file_name}]: {current_percent}% ({progress['written'] / 1024 / 1024:.1f}MB / {file_size / 1024 / 1024:.1f}MB)")
+                        progress['logged'] = current_percent
+            
+            if pending is not None:
+                await asyncio.shield(pending)
+                pending = None
+            if batch:
+                await _fd_op(loop, _write_chunks, fd, batch, position)
+                position += batch_bytes
+        finally:
+            # Never let the caller close the fd under a write that is still running
+            if pending is not None:
+                await asyncio.wait([pending])
+        # yield_file stops quietly on timeouts; a short range would leave a hole the size check can't see
+        if position != end:
+            raise IOError(f"Incomplete range {start}-{end} of {file_name}: got {position - start} bytes")
+    
     def _generate_cache_key(self, chat_id: int, msg_id: int, secure_hash: str) -> str:
         """Generate unique cache key for a media file."""
-        return f"{chat_id}:{msg_id}:{secure_hash}"
+        return cache_key_for(chat_id, msg_id, secure_hash)
     
     def _generate_filename(self, cache_key: str, extension: str) -> str:
         """Generate safe filename from cache key."""
-        hash_name = hashlib.md5(cache_key.encode()).hexdigest()
-        return f"{hash_name}{extension}"
+        return cache_filename_for(cache_key, extension)
     
     def _is_cacheable(self, mime_type: str, file_name: str = None) -> bool:
         """Check if file type is cacheable."""
-        if mime_type and mime_type in CACHEABLE_MIMETYPES:
+        if mime_type in CACHEABLE_MIMETYPES:
             return True
-        if file_name:
-            ext = Path(file_name).suffix.lower()
-            for exts in CACHEABLE_EXTENSIONS.values():
-                if ext in exts:
-                    return True
-        return False
+        return bool(file_name) and Path(file_name).suffix.lower() in ALL_CACHEABLE_EXTENSIONS
     
-    def _calculate_score(self, access_count: int, last_access: datetime) -> float:
+    def _calculate_score(self, access_count: int, last_access_ts: float) -> float:
         """Calculate eviction score (lower = evict first)."""
-        # Base score from access count
-        score = access_count * self.K_FACTOR
+        return self._score_fn(access_count, last_access_ts)
+    
+    def _make_score_fn(self):
+        """Build the score formula with K_FACTOR and the decay rate bound as closure constants."""
+        k_factor = self.K_FACTOR
+        # Recency bonus lost per second: 10 points every RECENCY_DECAY_HOURS
+        decay_per_second = 10 / (self.RECENCY_DECAY_HOURS * 3600)
+        clock = time.time
         
-        # Add recency bonus (decays over time)
-        hours_since_access = (datetime.utcnow() - last_access).total_seconds() / 3600
-        recency_bonus = max(0, 100 - (hours_since_access / self.RECENCY_DECAY_HOURS * 10))
+        def score(access_count: int, last_access_ts: float) -> float:
+            # Base score from access count plus a recency bonus that decays over time
+            return access_count * k_factor + max(0, 100 - (clock() - last_access_ts) * decay_per_second)
         
-        return score + recency_bonus
+        return score
     
-    def get_cached_path(self, chat_id: int, msg_id: int, secure_hash: str) -> Optional[Path]:
+    async def get_cached_path(self, chat_id: int, msg_id: int, secure_hash: str) -> Optional[Path]:
         """Get cached file path if exists."""
         if not self.enabled:
             return None
             
         cache_key = self._generate_cache_key(chat_id, msg_id, secure_hash)
-        doc = self.collection.find_one({"cache_key": cache_key})
+        # A stream request looks the same file up more than once (route, then is_cached)
+        if (cached := self._path_cache.get(cache_key)) and (time.monotonic() - cached['time'] < PATH_CACHE_TTL):
+            self._path_cache.move_to_end(cache_key)
+            return cached['value']
+        path = await self._lookup_cached_path(cache_key)
+        self._path_cache[cache_key] = {'value': path, 'time': time.monotonic()}
+        self._path_cache.move_to_end(cache_key)
+        # Files being streamed stay; drop the keys nobody asked for lately
+        while len(self._path_cache) > PATH_CACHE_SIZE:
+            self._path_cache.popitem(last=False)
+        return path
+    
+    async def _lookup_cached_path(self, cache_key: str) -> Optional[Path]:
+        """Resolve a cache key to its file through Mongo and the disk listing."""
+        doc = await self._raw_collection.find_one({"cache_key": cache_key}, LOOKUP_PROJECTION)
         
         logging.debug(f"Cache lookup: key={cache_key}, found_in_db={doc is not None}")
         
         if doc:
             file_path = doc.get("file_path")
-            file_exists = os.path.exists(file_path) if file_path else False
+            # The listing is refreshed every DISK_SCAN_INTERVAL; only stat() what it doesn't know
+            file_exists = bool(file_path) and (Path(file_path).name in self._disk_files or os.path.exists(file_path))
             logging.info(f"Cache check: {file_path}, exists={file_exists}")
             
             if file_exists:
+                self._disk_files.add(Path(file_path).name)
                 return Path(file_path)
             else:
                 # File missing from disk, clean up DB entry
                 logging.warning(f"Cache file missing, cleaning DB: {cache_key}")
-                self.collection.delete_one({"cache_key": cache_key})
+                if (await self.collection.delete_one({"cache_key": cache_key})).deleted_count:
+                    self._current_size_bytes -= doc.get("file_size", 0)
         
         return None
     
-    def is_cached(self, chat_id: int, msg_id: int, secure_hash: str) -> bool:
+    async def is_cached(self, chat_id: int, msg_id: int, secure_hash: str) -> bool:
         """Check if media is cached."""
-        return self.get_cached_path(chat_id, msg_id, secure_hash) is not None
+        return await self.get_cached_path(chat_id, msg_id, secure_hash) is not None
     
     async def record_access(self, chat_id: int, msg_id: int, secure_hash: str) -> None:
-        """Record file access to update score."""
+        """Record file access to update score (written to Mongo by the next access flush)."""
         cache_key = self._generate_cache_key(chat_id, msg_id, secure_hash)
         
-        now = datetime.utcnow()
-        result = self.collection.find_one_and_update(
-            {"cache_key": cache_key},
-            {
-                "$inc": {"access_count": 1},
-                "$set": {"last_access": now}
-            },
-            return_document=True
-        )
+        # Every range request of a stream lands here; count them in memory and
+        # write them all in one bulk_write instead of one round trip each
+        if pending := self._pending_access.get(cache_key):
+            pending[1] += 1
+        else:
+            self._pending_access[cache_key] = [chat_id, 1]
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_access())
+    
+    async def _flush_access(self) -> None:
+        """Write the accesses recorded during the last ACCESS_FLUSH_DELAY seconds."""
+        try:
+            await asyncio.sleep(ACCESS_FLUSH_DELAY)
+        finally:
+            self._flush_task = None
+        pending, self._pending_access = self._pending_access, {}
         
-        # Trigger Smart Pre-Caching if this is a "new" access (or simply every time, logic handles dupes)
-        # To avoid spamming, maybe check if we just updated.
-        # But we need filename. 'result' contains OLD document (default return of find_one_and_update)
-        # If result is None, it means it wasn't in cache DB yet (maybe first stream?)
-        # Actually start_background_download inserts it later.
-        # This record_access is called by stream_from_cache.
-        
-        if result:
-            filename = result.get('file_name')
-            if filename:
-                 asyncio.create_task(self.smart_pre_cache(chat_id, filename))
-        
-        if result:
-            # Update score
-            new_score = self._calculate_score(result["access_count"], now)
-            self.collection.update_one(
-                {"cache_key": cache_key},
-                {"$set": {"score": new_score}}
-            )
+        now_ts = time.time()
+        now = datetime.fromtimestamp(now_ts, timezone.utc)
+        # A fresh access always earns the full recency bonus, so the whole score
+        # can be computed server-side in the same pipeline update as the counter
+        recency_bonus = self._calculate_score(0, now_ts)
+        ops = [
+            UpdateOne({"cache_key": cache_key}, [
+                {"$set": {"access_count": {"$add": ["$access_count", count]}, "last_access": now}},
+                {"$set": {"score": {"$add": [{"$multiply": ["$access_count", self.K_FACTOR]}, recency_bonus]}}}
+            ])
+            for cache_key, (_, count) in pending.items()
+        ]
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+            
+            # Trigger Smart Pre-Caching once per accessed file that is in the cache DB
+            # (files not there yet get their entry when their download finishes)
+            cursor = self.collection.find({"cache_key": {"$in": list(pending)}}, {"_id": 0, "cache_key": 1, "file_name": 1})
+            async for doc in cursor:
+                filename = doc.get('file_name')
+                if filename:
+                    asyncio.create_task(self.smart_pre_cache(pending[doc["cache_key"]][0], filename))
+        except Exception as e:
+            logging.error(f"Access flush error: {e}")
     
     async def add_to_cache(
         self, 
@@ -394,15 +638,8 @@ class MediaCache:
         # Determine extension
         if file_name:
             ext = Path(file_name).suffix.lower()
-        elif mime_type:
-            ext_map = {
-                'video/mp4': '.mp4', 'video/x-matroska': '.mkv',
-                'video/webm': '.webm', 'audio/mpeg': '.mp3',
-                'audio/mp4': '.m4a', 'audio/flac': '.flac'
-            }
-            ext = ext_map.get(mime_type, '.bin')
         else:
-            ext = '.bin'
+            ext = MIME_EXTENSIONS.get(mime_type, '.bin')
         
         filename = self._generate_filename(cache_key, ext)
         file_path = self.cache_dir / filename
@@ -411,40 +648,20 @@ class MediaCache:
         file_size = len(file_data)
         await self._ensure_space(file_size)
         
+        loop = asyncio.get_running_loop()
         try:
             # Write file
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            
-            now = datetime.utcnow()
-            score = self._calculate_score(1, now)
+            await loop.run_in_executor(None, file_path.write_bytes, file_data)
             
             # Save metadata
-            self.collection.update_one(
-                {"cache_key": cache_key},
-                {
-                    "$set": {
-                        "cache_key": cache_key,
-                        "file_path": str(file_path),
-                        "file_size": file_size,
-                        "mime_type": mime_type,
-                        "file_name": file_name,
-                        "access_count": 1,
-                        "last_access": now,
-                        "created_at": now,
-                        "score": score
-                    }
-                },
-                upsert=True
-            )
+            await self._save_entry(cache_key, file_path, file_size, mime_type, file_name)
             
             logging.info(f"Cached: {file_name or cache_key} ({file_size / 1024 / 1024:.1f}MB)")
             return file_path
             
         except Exception as e:
             logging.error(f"Cache write error: {e}")
-            if file_path.exists():
-                file_path.unlink()
+            await loop.run_in_executor(None, _remove_file, file_path)
             return None
     
     async def add_to_cache_streaming(
@@ -471,11 +688,7 @@ class MediaCache:
         if file_name:
             ext = Path(file_name).suffix.lower()
         else:
-            ext_map = {
-                'video/mp4': '.mp4', 'video/x-matroska': '.mkv',
-                'video/webm': '.webm', 'audio/mpeg': '.mp3',
-            }
-            ext = ext_map.get(mime_type, '.bin')
+            ext = MIME_EXTENSIONS.get(mime_type, '.bin')
         
         filename = self._generate_filename(cache_key, ext)
         file_path = self.cache_dir / filename
@@ -493,98 +706,208 @@ class MediaCache:
         file_name: str = None
     ) -> None:
         """Finalize cache entry after streaming write completes."""
-        if not file_path.exists():
+        if not await asyncio.get_running_loop().run_in_executor(None, file_path.exists):
             return
         
         cache_key = self._generate_cache_key(chat_id, msg_id, secure_hash)
-        now = datetime.utcnow()
-        score = self._calculate_score(1, now)
+        await self._save_entry(cache_key, file_path, file_size, mime_type, file_name)
         
-        self.collection.update_one(
+        logging.info(f"Cache finalized: {file_name or cache_key} ({file_size / 1024 / 1024:.1f}MB)")
+    
+    async def _save_entry(self, cache_key: str, file_path: Path, file_size: int, mime_type: str, file_name: str) -> None:
+        """Upsert the metadata of a freshly cached file and count it in the cache size."""
+        now_ts = time.time()
+        now = datetime.fromtimestamp(now_ts, timezone.utc)
+        score = self._calculate_score(1, now_ts)
+        
+        previous = await self.collection.find_one_and_update(
             {"cache_key": cache_key},
             {
+                # Fields that describe the media itself are only written once
+                "$setOnInsert": {
+                    "mime_type": mime_type,
+                    "file_name": file_name,
+                    "created_at": now
+                },
+                # A re-download may land under a new name/size, so the file fields stay in $set
                 "$set": {
-                    "cache_key": cache_key,
                     "file_path": str(file_path),
                     "file_size": file_size,
-                    "mime_type": mime_type,
-                    "file_name": file_name,
                     "access_count": 1,
                     "last_access": now,
-                    "created_at": now,
                     "score": score
                 }
             },
+            projection={"file_size": 1},
             upsert=True
         )
-        
-        logging.info(f"Cache finalized: {file_name or cache_key} ({file_size / 1024 / 1024:.1f}MB)")
+        self._disk_files.add(file_path.name)
+        self._path_cache.pop(cache_key, None)
+        # A re-cached file replaces its old entry's size
+        self._current_size_bytes += file_size - (previous.get("file_size", 0) if previous else 0)
+    
+    async def _recompute_cache_size(self) -> int:
+        """Sum file_size over the whole collection (slow path, used to reconcile the counter)."""
+        result = await self.collection.aggregate(CACHE_SIZE_PIPELINE).to_list(length=1)
+        return result[0]["total"] if result else 0
     
     def get_cache_size(self) -> int:
         """Get current cache size in bytes."""
-        total = 0
-        for doc in self.collection.find({}, {"file_size": 1}):
-            total += doc.get("file_size", 0)
-        return total
+        return self._current_size_bytes
+    
+    def _read_disk_free(self) -> Optional[int]:
+        """Free bytes on the cache disk, or None if it can't be read."""
+        try:
+            return shutil.disk_usage(self.cache_dir).free
+        except OSError:
+            return None
+    
+    def _disk_shortfall(self, needed_bytes: int) -> int:
+        """Bytes the cache disk is missing for needed_bytes, whatever the size limit allows."""
+        if self._disk_free is None:
+            return 0
+        return max(0, needed_bytes - self._disk_free)
+    
+    def _admit(self, needed_bytes: int) -> None:
+        # Preallocation takes the space right away; count it until the next scan rereads the disk
+        if self._disk_free is not None:
+            self._disk_free = max(0, self._disk_free - needed_bytes)
     
     async def _ensure_space(self, needed_bytes: int) -> None:
         """Ensure there's enough space, evicting files if necessary."""
-        current_size = self.get_cache_size()
-        target_size = self.max_size_bytes - needed_bytes
-        
-        if current_size <= target_size:
+        # Common case: below the high watermark with room on disk (as last read), nothing to do
+        if self._current_size_bytes + needed_bytes <= self._high_watermark and not self._disk_shortfall(needed_bytes):
+            self._admit(needed_bytes)
             return
         
+        async with self._evict_lock:
+            # A pass that ran while we waited may have made room already; reread the disk, it may be stale
+            loop = asyncio.get_running_loop()
+            self._disk_free = await loop.run_in_executor(None, self._read_disk_free)
+            shortfall = self._disk_shortfall(needed_bytes)
+            if self._current_size_bytes + needed_bytes > self._high_watermark or shortfall:
+                await self._evict(needed_bytes, shortfall)
+            self._admit(needed_bytes)
+    
+    async def _evict(self, needed_bytes: int, shortfall: int = 0) -> None:
+        """Evict lowest-score files until the cache is down to the low watermark."""
+        current_size = self.get_cache_size()
+        # Free enough in one pass that the next admissions don't evict again, and at least
+        # what the disk is missing when other data filled it before the limit was reached
+        target_size = min(self._low_watermark - needed_bytes, current_size - shortfall)
+        
         logging.info(f"Cache eviction triggered: Container full (limit {self.max_size_bytes/1024/1024/1024:.2f}GB). Need {needed_bytes/1024/1024:.1f}MB, current {current_size/1024/1024/1024:.2f}GB")
         
         # Get files sorted by score (lowest first = evict first)
-        cursor = self.collection.find().sort("score", ASCENDING)
+        cursor = self.collection.find({}, EVICTION_PROJECTION).sort("score", ASCENDING).batch_size(64)
         
-        for doc in cursor:
+        # Pick the victims first, then remove them in one batch
+        victims = []
+        async for doc in cursor:
             if current_size <= target_size:
                 break
-            
-            file_path = Path(doc["file_path"])
-            file_size = doc["file_size"]
-            
+            victims.append(doc)
+            current_size -= doc["file_size"]
+        
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, os.unlink, doc["file_path"]) for doc in victims),
+            return_exceptions=True
+        )
+        evicted = []
+        for doc, result in zip(victims, results):
+            # Already gone from disk is as good as unlinked
+            if isinstance(result, Exception) and not isinstance(result, FileNotFoundError):
+                logging.error(f"Eviction error: {result}")
+                continue
+            evicted.append(doc)
+            self._disk_files.discard(Path(doc["file_path"]).name)
+            self._path_cache.pop(doc["cache_key"], None)
+            logging.info(f"Evicted: {doc.get('file_name', doc['cache_key'])} (score: {doc['score']:.1f})")
+        
+        if evicted:
             try:
-                if file_path.exists():
-                    file_path.unlink()
-                self.collection.delete_one({"_id": doc["_id"]})
-                current_size -= file_size
-                logging.info(f"Evicted: {doc.get('file_name', doc['cache_key'])} (score: {doc['score']:.1f})")
+                await self.collection.delete_many({"cache_key": {"$in": [doc["cache_key"] for doc in evicted]}})
+                self._current_size_bytes -= sum(doc["file_size"] for doc in evicted)
             except Exception as e:
                 logging.error(f"Eviction error: {e}")
     
+    def _scan_disk_files(self) -> set:
+        """Names of the files currently in the cache directory."""
+        with os.scandir(self.cache_dir) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    
+    async def periodic_disk_scan(self):
+        """Background task to keep the cache directory listing and free space fresh."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(DISK_SCAN_INTERVAL)
+            try:
+                self._disk_files = await loop.run_in_executor(None, self._scan_disk_files)
+            except OSError as e:
+                logging.error(f"Cache directory scan failed: {e}")
+            self._disk_free = await loop.run_in_executor(None, self._read_disk_free)
+    
+    def start_disk_scan(self) -> None:
+        """Run periodic_disk_scan as a task held here, so it is neither collected nor left behind on shutdown."""
+        self._scan_task = asyncio.create_task(self.periodic_disk_scan())
+        self._scan_task.add_done_callback(self._disk_scan_done)
+    
+    def stop_disk_scan(self) -> None:
+        if self._scan_task is not None:
+            self._scan_task.cancel()
+            self._scan_task = None
+    
+    @staticmethod
+    def _disk_scan_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logging.error(f"Cache directory scan task stopped: {task.exception()}")
+    
     async def cleanup(self) -> Dict[str, Any]:
         """Periodic cleanup task."""
         if not self.enabled:
             return {"status": "disabled"}
         
-        # Remove orphaned DB entries (file doesn't exist on disk)
-        removed = 0
-        for doc in self.collection.find():
-            if not os.path.exists(doc["file_path"]):
-                self.collection.delete_one({"_id": doc["_id"]})
-                removed += 1
-        
-        # Recalculate all scores
-        now = datetime.utcnow()
-        for doc in self.collection.find():
-            new_score = self._calculate_score(doc["access_count"], doc["last_access"])
-            self.collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"score": new_score}}
-            )
+        # Remove orphaned DB entries (file doesn't exist on disk), listing the cache dir once
+        loop = asyncio.get_running_loop()
+        self._disk_files = await loop.run_in_executor(None, self._scan_disk_files)
+        existing = [str(self.cache_dir / name) for name in self._disk_files]
+        under_dir = {"$regex": f"^{re.escape(str(self.cache_dir))}/"}
+        result = await self.collection.delete_many({"file_path": {**under_dir, "$nin": existing}})
+        removed = result.deleted_count
+        # Paths stored in another form (CACHE_DIR changed, "./" prefix) can't be matched
+        # against the listing; check those one by one as before
+        others = await self.collection.find(
+            {"file_path": {"$not": under_dir}}, {"file_path": 1}).to_list(length=None)
+        if others:
+            missing = await loop.run_in_executor(
+                None, lambda: [doc["_id"] for doc in others
+                              if not (doc.get("file_path") and os.path.exists(doc["file_path"]))])
+            if missing:
+                result = await self.collection.delete_many({"_id": {"$in": missing}})
+                removed += result.deleted_count
+        if removed:
+            self._path_cache.clear()
         
-        current_size = self.get_cache_size()
+        # Recalculate all scores server-side, same formula as _calculate_score
+        hours_since_access = {"$divide": [{"$subtract": ["$$NOW", "$last_access"]}, 3600 * 1000]}
+        recency_bonus = {"$max": [0, {"$subtract": [100, {"$multiply": [{"$divide": [hours_since_access, self.RECENCY_DECAY_HOURS]}, 10]}]}]}
+        score = {"$add": [{"$multiply": ["$access_count", self.K_FACTOR]}, recency_bonus]}
+        # Only rewrite documents whose score moved; entries past the recency window keep theirs
+        await self.collection.update_many(
+            {"$expr": {"$ne": ["$score", score]}},
+            [{"$set": {"score": score}}]
+        )
+        
+        # Reconcile the running counter with what the collection actually holds
+        current_size = self._current_size_bytes = await self._recompute_cache_size()
         
         return {
             "status": "ok",
             "cache_size_gb": current_size / 1024 / 1024 / 1024,
             "max_size_gb": Telegram.CACHE_MAX_SIZE_GB,
             "orphans_removed": removed,
-            "files_cached": self.collection.count_documents({})
+            "files_cached": await self.collection.count_documents({})
         }
 
 
@@ -597,59 +920,33 @@ class MediaCache:
         """
         import re
         from bot.helper.database import Database
+        from bot.helper.utils import match_episode, series_key
         
         logging.info(f"Smart Pre-Caching: Analyzing {current_filename}")
         
-        # Regex to find episode number (supports 01, 1, etc.)
-        # Groups: 1=Prefix, 2=EpisodeNum, 3=Suffix
-        patterns = [
-            # Pattern: "Title - 04 [1080p]" or "Title_-_04_[1080p]"
-            r'(.*[\s_]-[\s_])(\d{1,3})([\s_]\[.*)',     
-            # Pattern: "Title--12 End 720p" or "Title--11 720p" (with spaces or underscores)
-            # Matches prefix ending in --, then digits, then optional " End", then resolution
-            r'(.*--)(\d{1,3})((?:[\s_]End)?[\s_]\d{3,4}p)', 
-            # Pattern: "Title--04" (simple)
-            r'(.*--)(\d{1,3})(.*)',         
-            # Generic fallback: "Title 04 Suffix" or "Title_04_Suffix"
-            r'(.*[\s_])(\d{1,3})([\s_].*)'          
-        ]
+        # Groups: 1=Prefix, 2=EpisodeNum, 3=Suffix (see EPISODE_PATTERNS)
+        match = match_episode(current_filename)
+        if not match:
+            logging.debug("Smart Pre-Caching: Could not predict next episode pattern.")
+            return
         
-        next_filename_pattern = None
+        prefix = match.group(1)
+        ep_num_str = match.group(2)
+        next_ep = int(ep_num_str) + 1
         
-        for pattern in patterns:
-            match = re.match(pattern, current_filename)
-            if match:
-                prefix = match.group(1)
-                ep_num_str = match.group(2)
-                suffix = match.group(3)
-                
-                try:
-                    curr_ep = int(ep_num_str)
-                    next_ep = curr_ep + 1
-                    
-                    # Pad with zero if original was padded (e.g. 04 -> 05)
-                    next_ep_str = str(next_ep).zfill(len(ep_num_str))
-                    
-                    # Create regex for next file search
-                    # We use regex search in DB because exact suffix might differ slightly
-                    next_filename_pattern = f"^{re.escape(prefix)}{next_ep_str}.*"
-                    logging.info(f"Smart Pre-Caching: Prediction matched. Looking for pattern: {next_filename_pattern}")
-                    break
-                except ValueError:
-                    continue
+        # Pad with zero if original was padded (e.g. 04 -> 05)
+        next_ep_str = str(next_ep).zfill(len(ep_num_str))
         
-        if not next_filename_pattern:
-            logging.debug("Smart Pre-Caching: Could not predict next episode pattern.")
-            return
+        # Telegram search results are still checked against the name pattern
+        next_filename_pattern = f"^{re.escape(prefix)}{next_ep_str}.*"
+        logging.info(f"Smart Pre-Caching: Prediction matched. Looking for pattern: {next_filename_pattern}")
 
         try:
-            # Search for Next Episode in Database
-            # Search for Next Episode in Database
             db = Database()
             
-            # 1. Try DB Search
-            regex_query = {"chat_id": str(chat_id), "title": {"$regex": next_filename_pattern, "$options": "i"}}
-            next_file = await db.files.find_one(regex_query)
+            # 1. Try DB Search (equality on the indexed series_key/episode_num)
+            next_file = await db.files.find_one(
+                {"chat_id": str(chat_id), "series_key": series_key(prefix), "episode_num": next_ep})
             
             if not next_file:
                  logging.info("Smart Pre-Caching: Next episode not found in DB. Searching in Telegram Channel...")
@@ -661,7 +958,7 @@ class MediaCache:
                 next_msg_id = next_file['msg_id']
                 next_hash = next_file['hash']
                 
-                if self.is_cached(chat_id, next_msg_id, next_hash):
+                if await self.is_cached(chat_id, next_msg_id, next_hash):
                         logging.info("Smart Pre-Caching: Next episode is already cached. Skipping.")
                         return
 
@@ -687,6 +984,8 @@ class MediaCache:
         query = query.strip()
         
         client = UserBot if len(Config.SESSION_STRING) > 0 else StreamBot
+        # Compiled once for all the search results
+        name_re = re.compile(pattern, re.IGNORECASE)
         
         try:
             # Search messages in chat
@@ -700,7 +999,7 @@ class MediaCache:
                 if not filename: continue
                 
                 # Check regex match
-                if re.match(pattern, filename, re.IGNORECASE):
+                if name_re.match(filename):
                      logging.info(f"Smart Pre-Caching: Found file in Telegram: {filename}")
                      
                      # Extract file info
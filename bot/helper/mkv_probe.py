@@ -0,0 +1,154 @@
+"""
+Matroska Track Probe
+Reads the track list of an MKV file from its first bytes, without FFprobe
+"""
+
+from typing import Optional, List, Dict, Any
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+TRACKS = 0x1654AE6B
+CLUSTER = 0x1F43B675
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+LANGUAGE = 0x22B59C
+NAME = 0x536E
+
+TRACK_TYPE_SUBTITLE = 0x11
+# Track types FFmpeg turns into streams; stream indices count only these
+STREAM_TRACK_TYPES = frozenset({0x01, 0x02, TRACK_TYPE_SUBTITLE, 0x21})
+
+# Matroska CodecID -> FFmpeg codec_name, as reported by FFprobe
+SUBTITLE_CODECS = {
+    "S_TEXT/UTF8": "subrip",
+    "S_TEXT/ASCII": "text",
+    "S_TEXT/ASS": "ass",
+    "S_TEXT/SSA": "ass",
+    "S_ASS": "ass",
+    "S_SSA": "ass",
+    "S_TEXT/WEBVTT": "webvtt",
+    "D_WEBVTT/SUBTITLES": "webvtt",
+    "S_VOBSUB": "dvd_subtitle",
+    "S_DVBSUB": "dvb_subtitle",
+    "S_HDMV/PGS": "hdmv_pgs_subtitle",
+    "S_HDMV/TEXTST": "hdmv_text_subtitle",
+}
+
+# Size field with all value bits set: element size unknown (live/streamed Segment)
+UNKNOWN_SIZE = -1
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> Optional[tuple]:
+    """Decode an EBML variable-size integer at pos; returns (value, next_pos) or None if truncated."""
+    if pos >= len(data):
+        return None
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8 or pos + length > len(data):
+        return None
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = value == mask - 1
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        value = UNKNOWN_SIZE
+    return value, pos + length
+
+
+def _read_header(data: bytes, pos: int) -> Optional[tuple]:
+    """Decode an element header at pos; returns (id, size, data_pos) or None if truncated."""
+    element_id = _read_vint(data, pos, keep_marker=True)
+    if element_id is None:
+        return None
+    size = _read_vint(data, element_id[1], keep_marker=False)
+    if size is None:
+        return None
+    return element_id[0], size[0], size[1]
+
+
+def _parse_track_entry(data: bytes, pos: int, end: int) -> Dict[str, Any]:
+    """Read the fields of one TrackEntry element."""
+    entry = {"type": None, "codec": "", "language": "eng", "title": ""}
+    while pos < end:
+        header = _read_header(data, pos)
+        if header is None:
+            break
+        element_id, size, pos = header
+        value = data[pos:pos + size]
+        if element_id == TRACK_TYPE:
+            entry["type"] = int.from_bytes(value, "big")
+        elif element_id == CODEC_ID:
+            entry["codec"] = value.rstrip(b"\0").decode("ascii", "replace")
+        elif element_id == LANGUAGE:
+            entry["language"] = value.rstrip(b"\0").decode("ascii", "replace")
+        elif element_id == NAME:
+            entry["title"] = value.rstrip(b"\0").decode("utf-8", "replace")
+        pos += size
+    return entry
+
+
+def parse_mkv_tracks(data: bytes) -> Optional[List[Dict[str, Any]]]:
+    """
+    Find the subtitle tracks of an MKV file from its first bytes.
+
+    Args:
+        data: Start of the file; the Tracks element must be complete in it
+
+    Returns:
+        List of dicts with index (FFmpeg stream index), codec, language and title,
+        or None if data is not MKV or doesn't hold the whole Tracks element
+    """
+    header = _read_header(data, 0)
+    if header is None or header[0] != EBML_HEADER or header[1] == UNKNOWN_SIZE:
+        return None
+
+    pos = header[2] + header[1]
+    header = _read_header(data, pos)
+    if header is None or header[0] != SEGMENT:
+        return None
+
+    # Walk the top-level Segment children up to Tracks; their bodies are skipped, not read
+    pos = header[2]
+    while True:
+        header = _read_header(data, pos)
+        if header is None:
+            return None
+        element_id, size, pos = header
+        if element_id == TRACKS:
+            break
+        if element_id == CLUSTER or size == UNKNOWN_SIZE:
+            # Media data before any Tracks: leave it to FFprobe
+            return None
+        pos += size
+
+    end = pos + size
+    if size == UNKNOWN_SIZE or end > len(data):
+        return None
+
+    tracks = []
+    stream_index = 0
+    while pos < end:
+        header = _read_header(data, pos)
+        if header is None:
+            return None
+        element_id, size, pos = header
+        if element_id == TRACK_ENTRY:
+            entry = _parse_track_entry(data, pos, pos + size)
+            if entry["type"] in STREAM_TRACK_TYPES:
+                if entry["type"] == TRACK_TYPE_SUBTITLE:
+                    tracks.append({
+                        "index": stream_index,
+                        "codec": SUBTITLE_CODECS.get(entry["codec"], "unknown"),
+                        "language": entry["language"],
+                        "title": entry["title"]
+                    })
+                stream_index += 1
+        pos += size
+
+    return tracks
@@ -7,35 +7,49 @@ import asyncio
 import hashlib
 import logging
 import os
-from datetime import datetime, timedelta
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+from aiofiles import open as aiopen
+
 # Cache configuration
 CACHE_DIR = Path("cache/subtitles")
 CACHE_TTL_DAYS = 7  # Subtitle files are kept for 7 days
+CACHE_TTL_SECONDS = CACHE_TTL_DAYS * 24 * 60 * 60
+LOCK_CAPACITY = 1024  # Per-video extraction locks kept around (least recently used dropped first)
+
+
+@lru_cache(maxsize=4096)
+def subtitle_cache_key(chat_id: int, msg_id: int, secure_hash: str, track_index: int = 0) -> str:
+    """Unique cache key for a subtitle file (memoized: one request derives it several times)."""
+    raw_key = f"{chat_id}_{msg_id}_{secure_hash}_{track_index}"
+    # Opaque name, not a security boundary: BLAKE2b is faster than MD5 at the same width
+    return hashlib.blake2b(raw_key.encode(), digest_size=16).hexdigest()
 
 
 class SubtitleCache:
     """Manages cached subtitle files extracted from MKV videos."""
     
-    def __init__(self):
+    def __init__(self, capacity: int = LOCK_CAPACITY):
         self.cache_dir = CACHE_DIR
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self._processing_locks: dict[str, asyncio.Lock] = {}
+        self._lock_capacity = capacity
+        self._processing_locks: OrderedDict[str, asyncio.Lock] = OrderedDict()
         self._processing_tasks: set[str] = set()
         logging.info(f"Subtitle cache initialized at {self.cache_dir}")
     
     def _generate_cache_key(self, chat_id: int, msg_id: int, secure_hash: str, track_index: int = 0) -> str:
         """Generate unique cache key for a subtitle file."""
-        raw_key = f"{chat_id}_{msg_id}_{secure_hash}_{track_index}"
-        return hashlib.md5(raw_key.encode()).hexdigest()
+        return subtitle_cache_key(chat_id, msg_id, secure_hash, track_index)
     
     def _get_cache_path(self, cache_key: str) -> Path:
         """Get the file path for a cached subtitle."""
         return self.cache_dir / f"{cache_key}.ass"
     
-    def get_cached_subtitle(self, chat_id: int, msg_id: int, secure_hash: str, track_index: int = 0) -> Optional[Path]:
+    async def get_cached_subtitle(self, chat_id: int, msg_id: int, secure_hash: str, track_index: int = 0) -> Optional[Path]:
         """
         Get cached subtitle path if exists and not expired.
         
@@ -43,19 +57,26 @@ class SubtitleCache:
             Path to cached .ass file or None if not cached
         """
         cache_key = self._generate_cache_key(chat_id, msg_id, secure_hash, track_index)
+        # stat() and unlink() run in a thread so a slow filesystem doesn't stall the event loop
+        return await asyncio.to_thread(self._lookup, cache_key)
+    
+    def _lookup(self, cache_key: str) -> Optional[Path]:
+        """Blocking part of get_cached_subtitle: one stat() for existence and age."""
         cache_path = self._get_cache_path(cache_key)
         
-        if cache_path.exists():
-            # Check if file is too old
-            mtime = datetime.fromtimestamp(cache_path.stat().st_mtime)
-            if datetime.now() - mtime < timedelta(days=CACHE_TTL_DAYS):
-                logging.info(f"Subtitle cache HIT: {cache_key}")
-                return cache_path
-            else:
-                # Expired, remove it
-                logging.info(f"Subtitle cache EXPIRED: {cache_key}")
-                cache_path.unlink(missing_ok=True)
+        try:
+            mtime = cache_path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        
+        # Check if file is too old (mtime is wall-clock seconds, so compare with time.time())
+        if time.time() - mtime < CACHE_TTL_SECONDS:
+            logging.info(f"Subtitle cache HIT: {cache_key}")
+            return cache_path
         
+        # Expired, remove it
+        logging.info(f"Subtitle cache EXPIRED: {cache_key}")
+        cache_path.unlink(missing_ok=True)
         return None
     
     async def cache_subtitle(self, chat_id: int, msg_id: int, secure_hash: str, 
@@ -79,13 +100,14 @@ class SubtitleCache:
         # Write to temp file first, then rename (atomic operation)
         temp_path = cache_path.with_suffix('.tmp')
         try:
-            temp_path.write_bytes(content)
-            temp_path.rename(cache_path)
+            async with aiopen(temp_path, 'wb') as f:
+                await f.write(content)
+            await asyncio.to_thread(os.replace, temp_path, cache_path)
             logging.info(f"Subtitle cached: {cache_key} ({len(content)} bytes)")
             return cache_path
         except Exception as e:
             logging.error(f"Failed to cache subtitle: {e}")
-            temp_path.unlink(missing_ok=True)
+            await asyncio.to_thread(temp_path.unlink, missing_ok=True)
             raise
     
     def is_processing(self, chat_id: int, msg_id: int, secure_hash: str) -> bool:
@@ -96,9 +118,27 @@ class SubtitleCache:
     async def get_lock(self, chat_id: int, msg_id: int, secure_hash: str) -> asyncio.Lock:
         """Get or create a lock for processing a specific subtitle."""
         cache_key = self._generate_cache_key(chat_id, msg_id, secure_hash)
-        if cache_key not in self._processing_locks:
-            self._processing_locks[cache_key] = asyncio.Lock()
-        return self._processing_locks[cache_key]
+        lock = self._processing_locks.get(cache_key)
+        if lock is None:
+            lock = self._processing_locks[cache_key] = asyncio.Lock()
+            if len(self._processing_locks) > self._lock_capacity:
+                self._evict_idle_locks()
+        else:
+            self._processing_locks.move_to_end(cache_key)
+        return lock
+    
+    @staticmethod
+    def _lock_idle(lock: asyncio.Lock) -> bool:
+        """True if nobody holds or waits for lock, so dropping it can't split a queue."""
+        return not lock.locked() and not getattr(lock, '_waiters', None)
+    
+    def _evict_idle_locks(self):
+        """Drop the least recently used idle locks until back under capacity."""
+        for cache_key in list(self._processing_locks):
+            if len(self._processing_locks) <= self._lock_capacity:
+                break
+            if self._lock_idle(self._processing_locks[cache_key]):
+                del self._processing_locks[cache_key]
     
     def mark_processing(self, chat_id: int, msg_id: int, secure_hash: str, processing: bool):
         """Mark a subtitle as being processed or finished."""
@@ -107,27 +147,40 @@ class SubtitleCache:
             self._processing_tasks.add(cache_key)
         else:
             self._processing_tasks.discard(cache_key)
+            # Called by the lock holder just before it releases: with nobody queued
+            # behind it the lock has no further use (the next request finds the cache)
+            lock = self._processing_locks.get(cache_key)
+            if lock is not None and not getattr(lock, '_waiters', None):
+                del self._processing_locks[cache_key]
     
     async def cleanup_old_files(self):
         """Remove expired subtitle files from cache."""
         if not self.cache_dir.exists():
             return
         
-        cutoff = datetime.now() - timedelta(days=CACHE_TTL_DAYS)
-        removed_count = 0
-        
-        for file_path in self.cache_dir.glob("*.ass"):
-            try:
-                mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
-                if mtime < cutoff:
-                    file_path.unlink()
-                    removed_count += 1
-            except Exception as e:
-                logging.warning(f"Failed to cleanup {file_path}: {e}")
+        # The directory walk runs in a thread so a slow filesystem doesn't stall the event loop
+        removed_count = await asyncio.to_thread(self._remove_expired, time.time() - CACHE_TTL_SECONDS)
         
         if removed_count > 0:
             logging.info(f"Subtitle cache cleanup: removed {removed_count} expired files")
     
+    def _remove_expired(self, cutoff: float) -> int:
+        """Delete .ass files last modified before cutoff; returns how many were removed."""
+        removed_count = 0
+        
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".ass"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        removed_count += 1
+                except OSError as e:
+                    logging.warning(f"Failed to cleanup {entry.path}: {e}")
+        
+        return removed_count
+    
     async def periodic_cleanup(self):
         """Background task to periodically clean up old files."""
         while True:
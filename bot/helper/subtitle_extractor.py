@@ -6,15 +6,22 @@ Extracts embedded subtitle tracks from MKV files
 import asyncio
 import json
 import logging
-import os
 import tempfile
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 
+from bot.helper.mkv_probe import parse_mkv_tracks
+
 # Maximum bytes to download for subtitle extraction
 # MKV container stores metadata at the beginning, 100MB is usually enough
 MAX_DOWNLOAD_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Bytes read from the start of a video to find its tracks (FFprobe's default probesize)
+PROBE_SIZE = 5 * 1024 * 1024  # 5 MB
+
+# Text codecs ffmpeg can convert to ASS; bitmap tracks (PGS, VobSub) would fail the whole run
+TEXT_SUBTITLE_CODECS = frozenset({"ass", "ssa", "subrip", "srt", "webvtt", "mov_text", "text"})
+
 
 class SubtitleTrackInfo:
     """Information about a subtitle track in a video."""
@@ -29,35 +36,67 @@ class SubtitleTrackInfo:
         return f"SubtitleTrack(index={self.index}, codec={self.codec}, lang={self.language}, title={self.title})"
 
 
-async def detect_subtitle_tracks(video_path: Path) -> List[SubtitleTrackInfo]:
+def _read_head(video_path: Path) -> bytes:
+    """First PROBE_SIZE bytes of a video file."""
+    with open(video_path, 'rb') as f:
+        return f.read(PROBE_SIZE)
+
+
+def _read_outputs(outputs: Dict[int, Path]) -> Dict[int, bytes]:
+    """Contents of the non-empty files among outputs, by key."""
+    results = {}
+    for i, output_path in outputs.items():
+        if output_path.exists() and output_path.stat().st_size > 0:
+            results[i] = output_path.read_bytes()
+    return results
+
+
+async def detect_subtitle_tracks(video_path: Optional[Path], head: Optional[bytes] = None) -> List[SubtitleTrackInfo]:
     """
-    Detect all subtitle tracks in a video file using FFprobe.
+    Detect all subtitle tracks in a video file.
+    
+    MKV track headers are parsed in-process from the start of the file;
+    FFprobe is only run for other containers.
     
     Args:
-        video_path: Path to the video file
+        video_path: Path to the video file, or None to probe head only
+        head: Start of the video, when video_path is None
         
     Returns:
         List of SubtitleTrackInfo objects
     """
     try:
+        if video_path is not None:
+            head = await asyncio.to_thread(_read_head, video_path)
+        
+        parsed = parse_mkv_tracks(head)
+        if parsed is not None:
+            tracks = [SubtitleTrackInfo(**track) for track in parsed]
+            logging.info(f"Found {len(tracks)} subtitle tracks in {video_path.name if video_path else 'stream'} (MKV headers)")
+            return tracks
+        
         cmd = [
             "ffprobe",
             "-v", "quiet",
             "-print_format", "json",
             "-show_streams",
             "-select_streams", "s",  # Only subtitle streams
-            str(video_path)
+            "pipe:0" if video_path is None else str(video_path)
         ]
         
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await proc.communicate()
+        if video_path is None:
+            returncode, stdout, stderr = await run_with_input(cmd, _iter_chunks([head]))
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await proc.communicate()
+            returncode = proc.returncode
         
-        if proc.returncode != 0:
+        if returncode != 0:
             logging.warning(f"FFprobe failed: {stderr.decode()}")
             return []
         
@@ -74,7 +113,7 @@ async def detect_subtitle_tracks(video_path: Path) -> List[SubtitleTrackInfo]:
             )
             tracks.append(track)
         
-        logging.info(f"Found {len(tracks)} subtitle tracks in {video_path.name}")
+        logging.info(f"Found {len(tracks)} subtitle tracks in {video_path.name if video_path else 'stream'}")
         return tracks
         
     except Exception as e:
@@ -82,27 +121,26 @@ async def detect_subtitle_tracks(video_path: Path) -> List[SubtitleTrackInfo]:
         return []
 
 
-async def extract_subtitle(video_path: Path, stream_index: int, output_path: Path) -> bool:
+async def extract_subtitle(video_path: Path, stream_index: int) -> Optional[bytes]:
     """
     Extract a specific subtitle track from video to ASS format.
     
     Args:
         video_path: Path to the video file
         stream_index: Stream index of the subtitle track
-        output_path: Path to save the extracted .ass file
         
     Returns:
-        True if extraction successful, False otherwise
+        Subtitle content as bytes, or None if extraction failed
     """
     try:
         cmd = [
             "ffmpeg",
-            "-y",  # Overwrite output
             "-v", "warning",
             "-i", str(video_path),
             "-map", f"0:{stream_index}",
             "-c:s", "ass",  # Convert to ASS format
-            str(output_path)
+            "-f", "ass",
+            "pipe:1"  # Read from stdout: no output file to create and clean up
         ]
         
         proc = await asyncio.create_subprocess_exec(
@@ -111,86 +149,189 @@ async def extract_subtitle(video_path: Path, stream_index: int, output_path: Pat
             stderr=asyncio.subprocess.PIPE
         )
         
-        _, stderr = await proc.communicate()
+        stdout, stderr = await proc.communicate()
         
         if proc.returncode != 0:
             logging.error(f"FFmpeg extraction failed: {stderr.decode()}")
-            return False
+            return None
         
-        if output_path.exists() and output_path.stat().st_size > 0:
-            logging.info(f"Subtitle extracted successfully: {output_path.name}")
-            return True
+        if stdout:
+            logging.info(f"Subtitle extracted successfully: {len(stdout)} bytes")
+            return stdout
         else:
-            logging.warning("FFmpeg completed but output file is empty or missing")
-            return False
+            logging.warning("FFmpeg completed but output is empty")
+            return None
             
     except Exception as e:
         logging.error(f"Error extracting subtitle: {e}")
-        return False
+        return None
 
 
-async def download_partial_video(
-    chat_id: int,
-    msg_id: int,
-    secure_hash: str,
+async def extract_all_subtitles(
+    video_path: Optional[Path],
+    tracks: List[SubtitleTrackInfo],
+    source=None
+) -> Dict[int, bytes]:
+    """
+    Extract every text subtitle track to ASS format in a single FFmpeg pass.
+    
+    Args:
+        video_path: Path to the video file, or None to read the video from source
+        tracks: Tracks found by detect_subtitle_tracks
+        source: Async iterator of the video bytes, when video_path is None
+        
+    Returns:
+        Dict of position in tracks -> subtitle content, for the tracks extracted
+    """
+    wanted = [i for i, track in enumerate(tracks) if track.codec in TEXT_SUBTITLE_CODECS]
+    if not wanted:
+        logging.info("No text subtitle tracks to extract")
+        return {}
+    
+    with tempfile.TemporaryDirectory(prefix="subtitle_") as temp_dir:
+        outputs = {i: Path(temp_dir) / f"subtitle_{i}.ass" for i in wanted}
+        cmd = [
+            "ffmpeg",
+            "-y",  # Overwrite output
+            "-v", "warning",
+            "-i", "pipe:0" if video_path is None else str(video_path)
+        ]
+        # One output per track, so the input is read once for all of them
+        for i, output_path in outputs.items():
+            cmd += ["-map", f"0:{tracks[i].index}", "-c:s", "ass", str(output_path)]
+        
+        try:
+            if video_path is None:
+                returncode, _, stderr = await run_with_input(cmd, source)
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await proc.communicate()
+                returncode = proc.returncode
+        except Exception as e:
+            logging.error(f"Error extracting subtitles: {e}")
+            return {}
+        
+        if returncode != 0:
+            logging.error(f"FFmpeg extraction failed: {stderr.decode(errors='replace')}")
+            return {}
+        
+        results = await asyncio.to_thread(_read_outputs, outputs)
+        
+        logging.info(f"Extracted {len(results)} of {len(tracks)} subtitle tracks")
+        return results
+
+
+async def _iter_chunks(chunks: List[bytes], rest=None):
+    """Yield buffered chunks, then whatever is left in rest."""
+    for chunk in chunks:
+        yield chunk
+    if rest is not None:
+        async for chunk in rest:
+            yield chunk
+
+
+async def iter_partial_video(
     file_id,
     file_size: int,
     tg_connect,
     client_index: int,
-    output_path: Path,
     max_bytes: int = MAX_DOWNLOAD_SIZE
-) -> bool:
+):
     """
-    Download partial video file for subtitle extraction.
-    
-    This downloads only the first portion of the video, which is usually
-    sufficient for subtitle extraction since MKV stores metadata at the start.
+    Yield the first max_bytes of a video from Telegram, in 1MB chunks.
     
     Args:
-        chat_id: Telegram chat ID
-        msg_id: Message ID
-        secure_hash: Secure hash for verification
         file_id: Pyrogram FileId object
         file_size: Total file size
         tg_connect: ByteStreamer instance
         client_index: Client index for load balancing
-        output_path: Path to save the partial download
         max_bytes: Maximum bytes to download
+    """
+    download_size = min(file_size, max_bytes)
+    chunk_size = 1024 * 1024  # 1MB chunks
+    part_count = (download_size + chunk_size - 1) // chunk_size
+    
+    logging.info(f"Starting partial download: {download_size / 1024 / 1024:.1f} MB of {file_size / 1024 / 1024:.1f} MB")
+    
+    downloaded = 0
+    async for chunk in tg_connect.yield_file(
+        file_id, client_index, 0, 0, download_size, part_count, chunk_size
+    ):
+        yield chunk
+        downloaded += len(chunk)
+        
+        if downloaded >= download_size:
+            break
+
+
+async def run_with_input(cmd: List[str], source) -> tuple:
+    """
+    Run a command fed from an async iterator of chunks on its stdin.
+    
+    Args:
+        cmd: Command line to run
+        source: Async iterator of bytes written to the process stdin
         
     Returns:
-        True if download successful, False otherwise
+        (returncode, stdout, stderr)
     """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    
+    async def feed():
+        try:
+            async for chunk in source:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process stopped reading: it has what it needs (or failed, see returncode)
+            pass
+        finally:
+            proc.stdin.close()
+            await source.aclose()
     
     try:
-        # Calculate how much to download
-        download_size = min(file_size, max_bytes)
-        chunk_size = 1024 * 1024  # 1MB chunks
-        
-        logging.info(f"Starting partial download: {download_size / 1024 / 1024:.1f} MB of {file_size / 1024 / 1024:.1f} MB")
-        
-        with open(output_path, 'wb') as f:
-            downloaded = 0
-            part_count = (download_size + chunk_size - 1) // chunk_size
-            
-            async for chunk in tg_connect.yield_file(
-                file_id, client_index, 0, 0, download_size, part_count, chunk_size
-            ):
-                f.write(chunk)
-                downloaded += len(chunk)
-                
-                if downloaded >= download_size:
-                    break
+        # Output is read while feeding, so neither side blocks on a full pipe
+        _, stdout, stderr = await asyncio.gather(feed(), proc.stdout.read(), proc.stderr.read())
+        await proc.wait()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    
+    return proc.returncode, stdout, stderr
+
+
+async def probe_stream(source) -> tuple:
+    """
+    Buffer the start of a streamed video until its subtitle tracks are known.
+    
+    Stops as soon as the MKV Tracks element is complete (usually within the
+    first chunk), or after PROBE_SIZE bytes for other containers.
+    
+    Args:
+        source: Async iterator of the video bytes
         
-        if output_path.exists() and output_path.stat().st_size > 0:
-            logging.info(f"Partial download complete: {downloaded / 1024 / 1024:.1f} MB")
-            return True
-        else:
-            logging.warning("Download completed but file is empty")
-            return False
-            
-    except Exception as e:
-        logging.error(f"Error downloading partial video: {e}")
-        return False
+    Returns:
+        (buffered chunks, list of SubtitleTrackInfo)
+    """
+    head = []
+    head_size = 0
+    async for chunk in source:
+        head.append(chunk)
+        head_size += len(chunk)
+        if head_size >= PROBE_SIZE or parse_mkv_tracks(b''.join(head)) is not None:
+            break
+    
+    return head, await detect_subtitle_tracks(None, b''.join(head))
 
 
 async def extract_subtitle_from_telegram(
@@ -222,60 +363,42 @@ async def extract_subtitle_from_telegram(
     Returns:
         Subtitle content as bytes, or None if extraction failed
     """
-    temp_dir = tempfile.mkdtemp(prefix="subtitle_")
-    video_path = Path(temp_dir) / "video.mkv"
-    subtitle_path = Path(temp_dir) / "subtitle.ass"
+    from bot.helper.subtitle_cache import subtitle_cache
     
+    source = iter_partial_video(file_id, file_size, tg_connect, client_index)
     try:
-        # Step 1: Download partial video
-        download_success = await download_partial_video(
-            chat_id, msg_id, secure_hash, file_id, file_size,
-            tg_connect, client_index, video_path
-        )
-        
-        if not download_success:
-            logging.error("Failed to download video for subtitle extraction")
-            return None
-        
-        # Step 2: Detect subtitle tracks
-        tracks = await detect_subtitle_tracks(video_path)
+        # Step 1: Buffer the start of the download and detect subtitle tracks from it
+        head, tracks = await probe_stream(source)
         
         if not tracks:
             logging.info("No subtitle tracks found in video")
             return None
         
-        # Select the requested track (or first available)
-        if track_index >= len(tracks):
-            track_index = 0
-        
-        target_track = tracks[track_index]
-        logging.info(f"Extracting subtitle track: {target_track}")
-        
-        # Step 3: Extract subtitle
-        extract_success = await extract_subtitle(
-            video_path, target_track.index, subtitle_path
-        )
-        
-        if not extract_success:
-            logging.error("Failed to extract subtitle from video")
-            return None
-        
-        # Step 4: Read and return subtitle content
-        subtitle_content = subtitle_path.read_bytes()
-        logging.info(f"Subtitle extraction complete: {len(subtitle_content)} bytes")
-        
-        return subtitle_content
-        
+        # Step 2: Extract every track in one ffmpeg run, fed by the rest of the download
+        results = await extract_all_subtitles(None, tracks, _iter_chunks(head, source))
     finally:
-        # Cleanup temp files
-        try:
-            if video_path.exists():
-                video_path.unlink()
-            if subtitle_path.exists():
-                subtitle_path.unlink()
-            os.rmdir(temp_dir)
-        except Exception as e:
-            logging.warning(f"Failed to cleanup temp files: {e}")
+        await source.aclose()
+    
+    # Other tracks are usually asked for next; cache them all now
+    for i, content in results.items():
+        if i != track_index:
+            # A failed side write only costs a later extraction; the requested track is still served
+            try:
+                await subtitle_cache.cache_subtitle(chat_id, msg_id, secure_hash, content, i)
+            except Exception as e:
+                logging.error(f"Failed to cache subtitle track {i}: {e}")
+    
+    # Select the requested track (or first available)
+    if track_index >= len(tracks):
+        track_index = 0
+    
+    subtitle_content = results.get(track_index)
+    if not subtitle_content:
+        logging.error("Failed to extract subtitle from video")
+        return None
+    
+    logging.info(f"Subtitle extraction complete: {len(subtitle_content)} bytes")
+    return subtitle_content
 
 
 async def get_subtitle_track_list(
@@ -293,39 +416,25 @@ async def get_subtitle_track_list(
     Returns:
         List of dicts with track info (index, language, title, codec)
     """
-    temp_dir = tempfile.mkdtemp(prefix="subtitle_probe_")
-    video_path = Path(temp_dir) / "video.mkv"
-    
+    # Only the track headers are needed: stop the download once they are in
+    source = iter_partial_video(file_id, file_size, tg_connect, client_index, max_bytes=PROBE_SIZE)
     try:
-        # Download just 50MB for faster probing
-        download_success = await download_partial_video(
-            chat_id, msg_id, secure_hash, file_id, file_size,
-            tg_connect, client_index, video_path,
-            max_bytes=50 * 1024 * 1024
-        )
-        
-        if not download_success:
-            return []
-        
-        tracks = await detect_subtitle_tracks(video_path)
-        
-        return [
-            {
-                "index": t.index,
-                "language": t.language,
-                "title": t.title,
-                "codec": t.codec
-            }
-            for t in tracks
-        ]
-        
+        _, tracks = await probe_stream(source)
+    except Exception as e:
+        logging.error(f"Error downloading partial video: {e}")
+        return []
     finally:
-        try:
-            if video_path.exists():
-                video_path.unlink()
-            os.rmdir(temp_dir)
-        except:
-            pass
+        await source.aclose()
+    
+    return [
+        {
+            "index": t.index,
+            "language": t.language,
+            "title": t.title,
+            "codec": t.codec
+        }
+        for t in tracks
+    ]
 
 
 async def extract_subtitle_from_local_file(
@@ -336,34 +445,18 @@ async def extract_subtitle_from_local_file(
     Extract subtitle from a local video file.
     Does NOT require a Telegram download.
     """
-    temp_dir = tempfile.mkdtemp(prefix="subtitle_local_")
-    subtitle_path = Path(temp_dir) / "subtitle.ass"
+    # Detect tracks
+    tracks = await detect_subtitle_tracks(video_path)
+    if not tracks:
+        logging.info(f"No subtitle tracks found in {video_path}")
+        return None
     
-    try:
-        # Detect tracks
-        tracks = await detect_subtitle_tracks(video_path)
-        if not tracks:
-            logging.info(f"No subtitle tracks found in {video_path}")
-            return None
-        
-        # Select track
-        if track_index >= len(tracks):
-            track_index = 0
-        
-        target_track = tracks[track_index]
-        logging.info(f"Extracting local subtitle track: {target_track}")
-        
-        # Extract
-        success = await extract_subtitle(video_path, target_track.index, subtitle_path)
-        if not success:
-            return None
-            
-        return subtitle_path.read_bytes()
-        
-    finally:
-        try:
-            if subtitle_path.exists():
-                subtitle_path.unlink()
-            os.rmdir(temp_dir)
-        except Exception as e:
-            logging.warning(f"Failed to cleanup temp files: {e}")
+    # Select track
+    if track_index >= len(tracks):
+        track_index = 0
+    
+    target_track = tracks[track_index]
+    logging.info(f"Extracting local subtitle track: {target_track}")
+    
+    # Extract
+    return await extract_subtitle(video_path, target_track.index)
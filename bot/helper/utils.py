@@ -1,5 +1,36 @@
 import re
 
+# Regex to detect part files: Name.part01.mp4 or Name part 1.mkv
+# Use PART_RE.match: it returns the same groups as searching r'(.*)[ ._]part(\d+)'
+# (the lazy prefix skips whole lines, like search() restarting after a newline)
+# without retrying the greedy (.*) from every offset of a non-matching title
+PART_RE = re.compile(r'(?:.*\n)*?(.*)[ ._]part(\d+)', re.IGNORECASE)
+
+# Episode number patterns for smart pre-caching, tried in order
+# Groups: 1=Prefix, 2=EpisodeNum, 3=Suffix
+EPISODE_PATTERNS = (
+    # Pattern: "Title - 04 [1080p]" or "Title_-_04_[1080p]"
+    re.compile(r'(.*[\s_]-[\s_])(\d{1,3})([\s_]\[.*)'),
+    # Pattern: "Title--12 End 720p" or "Title--11 720p" (with spaces or underscores)
+    # Matches prefix ending in --, then digits, then optional " End", then resolution
+    re.compile(r'(.*--)(\d{1,3})((?:[\s_]End)?[\s_]\d{3,4}p)'),
+    # Pattern: "Title--04" (simple)
+    re.compile(r'(.*--)(\d{1,3})(.*)'),
+    # Generic fallback: "Title 04 Suffix" or "Title_04_Suffix"
+    re.compile(r'(.*[\s_])(\d{1,3})([\s_].*)'),
+)
+
+# Separators that indexing turns into spaces (see CLEAN_TABLE in index.py)
+SERIES_KEY_RE = re.compile(r"[\s._|,']+")
+
+# Channel ids are -100<id>; the web routes use the bare <id>
+CHANNEL_ID_OFFSET = 1000000000000
+
+def short_chat_id(chat_id):
+    """Integer equivalent of str(chat_id).replace("-100", "") for channel ids."""
+    chat_id = int(chat_id)
+    return -chat_id - CHANNEL_ID_OFFSET if chat_id <= -CHANNEL_ID_OFFSET else chat_id
+
 def group_posts_by_series(posts, title_key='title'):
     """
     Groups posts identifying series parts (e.g. Name.part01.mp4).
@@ -8,41 +39,72 @@ def group_posts_by_series(posts, title_key='title'):
     series_map = {}
     
     for post in posts:
-        # Regex to detect part files: Name.part01.mp4 or Name part 1.mkv
         title = post.get(title_key, '')
-        match = re.search(r'(.*)[ ._]part(\d+)', title, re.IGNORECASE)
+        # Most titles have no "part" at all; skip the regex for them
+        match = PART_RE.match(title) if 'part' in title.lower() else None
         
         if match:
             series_name = match.group(1).strip()
             part_number = int(match.group(2))
             
-            if series_name not in series_map:
-                series_map[series_name] = []
-            
             # Store part with its number
             post['part_number'] = part_number
-            series_map[series_name].append(post)
+            series_map.setdefault(series_name, []).append(post)
         else:
             grouped_posts.append(post)
             
+    return merge_series(grouped_posts, series_map, title_key)
+
+def merge_series(grouped_posts, series_map, title_key='title'):
+    """
+    Appends one representative post per series in series_map to grouped_posts.
+    """
     # Process Grouped Series
     for series_name, parts in series_map.items():
-        # Sort by part number
-        parts.sort(key=lambda x: x.get('part_number', 0))
-        
-        # Take the first part as representative
         if parts:
-            representative = parts[0]
-            representative['is_series'] = True
-            representative['parts_count'] = len(parts)
-            # Ensure the representative has the series title (optional, but good for display)
-            # But we shouldn't overwrite original title too destructively if needed specific file
-            # However, for listing, showing series name is usually expected.
-            representative[title_key] = series_name 
-            grouped_posts.append(representative)
+            grouped_posts.append(series_representative(series_name, parts, title_key))
     
     return grouped_posts
 
+def series_representative(series_name, parts, title_key='title'):
+    """
+    Marks the lowest-numbered part as the listing entry for its series.
+    """
+    # Sort by part number
+    parts.sort(key=lambda x: x.get('part_number', 0))
+    
+    # Take the first part as representative
+    representative = parts[0]
+    representative['is_series'] = True
+    representative['parts_count'] = len(parts)
+    # Ensure the representative has the series title (optional, but good for display)
+    # But we shouldn't overwrite original title too destructively if needed specific file
+    # However, for listing, showing series name is usually expected.
+    representative[title_key] = series_name 
+    return representative
+
+def match_episode(title):
+    """Returns the first EPISODE_PATTERNS match for title, or None."""
+    for pattern in EPISODE_PATTERNS:
+        if match := pattern.match(title):
+            return match
+    return None
+
+def series_key(prefix):
+    """
+    Normalizes an episode prefix so raw file names and indexed titles compare equal.
+    """
+    return SERIES_KEY_RE.sub(' ', prefix).strip().lower()
+
+def episode_fields(title):
+    """
+    series_key/episode_num stored on files documents for the next-episode lookup.
+    """
+    match = match_episode(title)
+    if not match:
+        return {'series_key': None, 'episode_num': None}
+    return {'series_key': series_key(match.group(1)), 'episode_num': int(match.group(2))}
+
 import orjson
 
 def json_dumps(data):
@@ -4,7 +4,7 @@ from pyrogram import utils, raw
 from pyrogram.errors import AuthBytesInvalid
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 from pyrogram.session import Session, Auth
-from typing import Dict, Union
+from typing import Dict, Tuple, Union
 from bot.helper.exceptions import FIleNotFound
 from bot.server.file_properties import get_file_ids
 from bot.telegram import work_loads
@@ -12,6 +12,9 @@ from pyrogram import Client
 
 
 class ByteStreamer:
+    # Shared by all instances: a streamer is built per request, sessions live on the client
+    _session_locks: Dict[Tuple[Client, int], asyncio.Lock] = {}
+
     def __init__(self, client: Client):
         self.clean_timer = 30 * 60
         self.client: Client = client
@@ -75,6 +78,15 @@ class ByteStreamer:
             work_loads[index] -= 1
 
     async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
+        media_session = client.media_sessions.get(file_id.dc_id, None)
+        if media_session is not None:
+            logging.debug(f"Using cached media session for DC {file_id.dc_id}")
+            return media_session
+        # Concurrent range downloads would otherwise each build (and leak) a session for the DC
+        async with self._session_locks.setdefault((client, file_id.dc_id), asyncio.Lock()):
+            return await self._create_media_session(client, file_id)
+
+    async def _create_media_session(self, client: Client, file_id: FileId) -> Session:
         media_session = client.media_sessions.get(file_id.dc_id, None)
         if media_session is None:
             if file_id.dc_id != await client.storage.dc_id():
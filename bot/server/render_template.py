@@ -8,6 +8,7 @@ from bot.config import Telegram
 from bot.helper.database import Database
 from bot.helper.exceptions import InvalidHash
 from bot.helper.file_size import get_readable_file_size
+from bot.helper.utils import PART_RE
 from bot.server.file_properties import get_file_ids
 from bot.telegram import StreamBot
 
@@ -30,7 +31,24 @@ hide_channel = """
 
 _theme_cache = {'value': None, 'time': 0}
 
-async def render_page(id, secure_hash, is_admin=False, html='', playlist='', database='', route='', redirect_url='', msg='', chat_id='', page=1):
+# Templates split once into [literal, field, literal, ...] around their <!-- Field --> markers
+_template_cache = {}
+
+async def load_template(tpath, name, *fields):
+    if (segments := _template_cache.get(name)) is None:
+        async with aiopen(ospath.join(tpath, name), 'r') as f:
+            text = await f.read()
+        marker = re.compile('<!-- (' + '|'.join(map(re.escape, fields)) + ') -->')
+        segments = _template_cache[name] = marker.split(text)
+    return segments
+
+def fill_template(segments, **values):
+    parts = segments[:]
+    for i in range(1, len(parts), 2):
+        parts[i] = values[parts[i]]
+    return ''.join(parts)
+
+async def get_theme():
     global _theme_cache
     if _theme_cache['value'] and (time.time() - _theme_cache['time'] < 60):
         theme = _theme_cache['value']
@@ -40,8 +58,10 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
             _theme_cache = {'value': theme, 'time': time.time()}
     if theme is None or theme == '':
         theme = Telegram.THEME
-    tpath = ospath.join('bot', 'server', 'template')
-    
+    return theme
+
+
+def pagination_buttons(page):
     # Pagination Logic
     prev_btn = ""
     next_btn = ""
@@ -85,27 +105,34 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
     </a>
     """
     # Note: verify updateParam doesn't duplicate if added twice (it won't because script ID or simple re-def is fine in HTML body)
-    
+    return prev_btn, next_btn
+
+
+async def render_page(id, secure_hash, is_admin=False, html='', playlist='', database='', route='', redirect_url='', msg='', chat_id='', page=1):
+    theme = await get_theme()
+    tpath = ospath.join('bot', 'server', 'template')
+    prev_btn, next_btn = pagination_buttons(page)
+
     if route == 'login':
-        async with aiopen(ospath.join(tpath, 'login.html'), 'r') as f:
-            html = (await f.read()).replace("<!-- Error -->", msg or '').replace("<!-- Theme -->", theme.lower()).replace("<!-- RedirectURL -->", redirect_url)
+        segments = await load_template(tpath, 'login.html', 'Error', 'Theme', 'RedirectURL')
+        html = fill_template(segments, Error=msg or '', Theme=theme.lower(), RedirectURL=redirect_url)
     elif route == 'home':
-        async with aiopen(ospath.join(tpath, 'home.html'), 'r') as f:
-            html = (await f.read()).replace("<!-- Print -->", html).replace("<!-- Theme -->", theme.lower()).replace("<!-- Playlist -->", playlist)
-            if not is_admin:
-                html += admin_block
-                if Telegram.HIDE_CHANNEL:
-                    html += hide_channel
+        segments = await load_template(tpath, 'home.html', 'Print', 'Theme', 'Playlist')
+        html = fill_template(segments, Print=html, Theme=theme.lower(), Playlist=playlist)
+        if not is_admin:
+            html += admin_block
+            if Telegram.HIDE_CHANNEL:
+                html += hide_channel
     elif route == 'playlist':
-        async with aiopen(ospath.join(tpath, 'playlist.html'), 'r') as f:
-            html = (await f.read()).replace("<!-- Theme -->", theme.lower()).replace("<!-- Playlist -->", playlist).replace("<!-- Database -->", database).replace("<!-- Title -->", msg).replace("<!-- Parent_id -->", id).replace("<!-- Prev -->", prev_btn).replace("<!-- Next -->", next_btn)
-            if not is_admin:
-                html += admin_block
+        segments = await load_template(tpath, 'playlist.html', 'Theme', 'Playlist', 'Database', 'Title', 'Parent_id', 'Prev', 'Next')
+        html = fill_template(segments, Theme=theme.lower(), Playlist=playlist, Database=database, Title=msg, Parent_id=id, Prev=prev_btn, Next=next_btn)
+        if not is_admin:
+            html += admin_block
     elif route == 'index':
-        async with aiopen(ospath.join(tpath, 'index.html'), 'r') as f:
-            html = (await f.read()).replace("<!-- Print -->", html).replace("<!-- Theme -->", theme.lower()).replace("<!-- Title -->", msg).replace("<!-- Chat_id -->", chat_id).replace("<!-- Prev -->", prev_btn).replace("<!-- Next -->", next_btn)
-            if not is_admin:
-                html += admin_block
+        segments = await load_template(tpath, 'index.html', 'Print', 'Theme', 'Title', 'Chat_id', 'Prev', 'Next')
+        html = fill_template(segments, Print=html, Theme=theme.lower(), Title=msg, Chat_id=chat_id, Prev=prev_btn, Next=next_btn)
+        if not is_admin:
+            html += admin_block
     else:
         file_data = await get_file_ids(StreamBot, chat_id=int(chat_id), message_id=int(id))
         if file_data.unique_id[:6] != secure_hash:
@@ -121,7 +148,7 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
         
         # Series/Part Detection & Playlist Generation
         playlist_html = ""
-        match = re.search(r'(.*)[ ._]part(\d+)', filename, re.IGNORECASE)
+        match = PART_RE.match(filename)
         if match:
             series_name = match.group(1).strip()
             try:
@@ -134,7 +161,7 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
                 all_parts = []
                 for post in search_results:
                     # Verify it matches the series name and has a part number
-                    p_match = re.search(r'(.*)[ ._]part(\d+)', post['title'], re.IGNORECASE)
+                    p_match = PART_RE.match(post['title'])
                     if p_match and p_match.group(1).strip().lower() == series_name.lower():
                         post['part_number'] = int(p_match.group(2))
                         all_parts.append(post)
@@ -202,10 +229,10 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
                 LOGGER.error(f"Error generating playlist: {e}")
 
         if tag == 'video':
-            async with aiopen(ospath.join(tpath, 'video.html')) as r:
-                poster = f"/api/thumb/{chat_id}?id={id}"
-                html = (await r.read()).replace('<!-- Filename -->', filename).replace("<!-- Theme -->", theme.lower()).replace('<!-- Poster -->', poster).replace('<!-- Size -->', size).replace('<!-- Username -->', StreamBot.me.username).replace('<!-- Playlist -->', playlist_html).replace('<!-- ID -->', str(id))
+            poster = f"/api/thumb/{chat_id}?id={id}"
+            segments = await load_template(tpath, 'video.html', 'Filename', 'Theme', 'Poster', 'Size', 'Username', 'Playlist', 'ID')
+            html = fill_template(segments, Filename=filename, Theme=theme.lower(), Poster=poster, Size=size, Username=StreamBot.me.username, Playlist=playlist_html, ID=str(id))
         else:
-            async with aiopen(ospath.join(tpath, 'dl.html')) as r:
-                html = (await r.read()).replace('<!-- Filename -->', filename).replace("<!-- Theme -->", theme.lower()).replace('<!-- Size -->', size)
-    return html
\ No newline at end of file
+            segments = await load_template(tpath, 'dl.html', 'Filename', 'Theme', 'Size')
+            html = fill_template(segments, Filename=filename, Theme=theme.lower(), Size=size)
+    return html
@@ -6,7 +6,7 @@ import mimetypes
 import secrets
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
-from bot.helper.chats import get_chats, post_playlist, posts_chat, posts_db_file
+from bot.helper.chats import clear_chat_cache, get_chats, post_playlist, posts_chat, posts_db_file
 from bot.helper.file_size import get_readable_file_size
 from bot.helper.database import Database
 from bot.helper.search import search
@@ -15,7 +15,7 @@ from bot.telegram import work_loads, multi_clients
 from aiohttp_session import get_session
 from bot.config import Telegram
 from bot.helper.exceptions import FIleNotFound, InvalidHash
-from bot.helper.index import get_files, posts_file
+from bot.helper.index import get_files, render_posts
 from bot.server.custom_dl import ByteStreamer
 from bot.server.render_template import render_page
 from bot.helper.cache import rm_cache
@@ -143,7 +143,8 @@ async def searchDbFolder_route(request):
     if (username := session.get('user')) != Telegram.ADMIN_USERNAME:
         return web.json_response({'msg': 'Who the hell you are'})
     query = request.query.get('query', '')
-    folder_names = await db.search_DbFolder(query)
+    page = request.query.get('page', '1')
+    folder_names = await db.search_DbFolder(query, page=page)
     return web.json_response(folder_names)
 
 
@@ -212,6 +213,7 @@ async def editConfig_route(request):
     success = await db.update_config(theme=theme, auth_channel=channel)
     if not success:
         return web.HTTPInternalServerError()
+    clear_chat_cache()
     return web.HTTPFound('/')
 
 
@@ -223,8 +225,8 @@ async def home_route(request):
         try:
             channels = await get_chats()
             playlists = await db.get_Dbfolder()
-            phtml = await posts_chat(channels)
-            dhtml = await post_playlist(playlists)
+            phtml = posts_chat(channels)
+            dhtml = post_playlist(playlists)
             is_admin = username == Telegram.ADMIN_USERNAME
             return web.Response(text=await render_page(None, None, route='home', html=phtml, playlist=dhtml, is_admin=is_admin), content_type='text/html')
         except Exception as e:
@@ -245,8 +247,8 @@ async def playlist_route(request):
             playlists = await db.get_Dbfolder(parent_id, page=page)
             files = await db.get_dbFiles(parent_id, page=page)
             text = await db.get_info(parent_id)
-            dhtml = await post_playlist(playlists)
-            dphtml = await posts_db_file(files)
+            dhtml = post_playlist(playlists)
+            dphtml = posts_db_file(files)
             is_admin = username == Telegram.ADMIN_USERNAME
             return web.Response(text=await render_page(parent_id, None, route='playlist', playlist=dhtml, database=dphtml, msg=text, is_admin=is_admin, page=int(page)), content_type='text/html')
         except Exception as e:
@@ -267,7 +269,7 @@ async def dbsearch_route(request):
         is_admin = username == Telegram.ADMIN_USERNAME
         try:
             files = await db.search_dbfiles(id=parent, page=page, query=query)
-            dphtml = await posts_db_file(files)
+            dphtml = posts_db_file(files)
             name = await db.get_info(parent)
             text = f"{name} - {query}"
             return web.Response(text=await render_page(parent, None, route='playlist', database=dphtml, msg=text, is_admin=is_admin, page=int(page)), content_type='text/html')
@@ -288,8 +290,7 @@ async def channel_route(request):
         page = request.query.get('page', '1')
         is_admin = username == Telegram.ADMIN_USERNAME
         try:
-            posts = await get_files(chat_id, page=page)
-            phtml = await posts_file(posts, chat_id)
+            phtml = await get_files(chat_id, page=page, as_html=True)
             chat = await StreamBot.get_chat(int(chat_id))
             return web.Response(text=await render_page(None, None, route='index', html=phtml, msg=chat.title, chat_id=chat_id.replace("-100", ""), is_admin=is_admin, page=int(page)), content_type='text/html')
         except Exception as e:
@@ -311,7 +312,8 @@ async def search_route(request):
         is_admin = username == Telegram.ADMIN_USERNAME
         try:
             posts = await search(chat_id, page=page, query=query)
-            phtml = await posts_file(posts, chat_id)
+            # Rendered in full before anything is sent, so a failure is still a 500 and not a cut-off page
+            phtml = await render_posts(posts, chat_id)
             chat = await StreamBot.get_chat(int(chat_id))
             text = f"{chat.title} - {query}"
             return web.Response(text=await render_page(None, None, route='index', html=phtml, msg=text, chat_id=chat_id.replace("-100", ""), is_admin=is_admin, page=int(page)), content_type='text/html')
@@ -357,7 +359,7 @@ async def get_subtitle(request):
             return web.HTTPBadRequest(text="Missing id or hash parameter")
         
         # Check cache first
-        cached_path = subtitle_cache.get_cached_subtitle(
+        cached_path = await subtitle_cache.get_cached_subtitle(
             int(chat_id), int(message_id), secure_hash, track_index
         )
         
@@ -379,7 +381,7 @@ async def get_subtitle(request):
         
         async with lock:
             # Check cache again (another request might have completed extraction)
-            cached_path = subtitle_cache.get_cached_subtitle(
+            cached_path = await subtitle_cache.get_cached_subtitle(
                 int(chat_id), int(message_id), secure_hash, track_index
             )
             if cached_path:
@@ -408,8 +410,10 @@ async def get_subtitle(request):
                     tg_connect = ByteStreamer(faster_client)
                     class_cache[faster_client] = tg_connect
                 
-                file_id = await tg_connect.get_file_properties(
-                    chat_id=int(chat_id), message_id=int(message_id)
+                # File properties (Telegram) and the local cache lookup (Mongo) don't depend on each other
+                file_id, cached_video_path = await asyncio.gather(
+                    tg_connect.get_file_properties(chat_id=int(chat_id), message_id=int(message_id)),
+                    media_cache.get_cached_path(int(chat_id), int(message_id), secure_hash)
                 )
                 
                 if file_id.unique_id[:6] != secure_hash:
@@ -417,8 +421,7 @@ async def get_subtitle(request):
                 
                 file_size = file_id.file_size
                 
-                # Check for cached video file first
-                cached_video_path = media_cache.get_cached_path(int(chat_id), int(message_id), secure_hash)
+                # Use the cached video file first
                 
                 if cached_video_path:
                     logging.info(f"Subtitle extraction: Using local cached video {cached_video_path}")
@@ -597,15 +600,21 @@ async def stream_from_cache(request: web.Request, cached_path, file_size: int, m
     
     async def file_sender():
         chunk_size = 4 * 1024 * 1024  # 4MB chunks for faster Disk I/O (Cache)
-        with open(cached_path, 'rb') as f:
+        loop = asyncio.get_running_loop()
+        # Disk reads run in the executor, so a cold 4MB read doesn't stall every other stream
+        f = await loop.run_in_executor(None, open, cached_path, 'rb')
+        try:
             f.seek(from_bytes)
             remaining = req_length
             while remaining > 0:
-                chunk = f.read(min(chunk_size, remaining))
+                chunk = await loop.run_in_executor(None, f.read, min(chunk_size, remaining))
                 if not chunk:
                     break
                 remaining -= len(chunk)
                 yield chunk
+        finally:
+            # Waits on the buffer lock for a read still running in the executor
+            f.close()
     
     logging.info(f"Streaming from cache: {file_name}")
     
@@ -645,10 +654,7 @@ async def admin_dashboard(request):
     
     # Fetch Cached Files (Top 50 recently accessed)
     from pymongo import DESCENDING
-    cached_files_cursor = media_cache.collection.find().sort("last_access", DESCENDING).limit(50)
-    cached_files = []
-    for doc in cached_files_cursor:
-        cached_files.append(doc)
+    cached_files = await media_cache.collection.find().sort("last_access", DESCENDING).limit(50).to_list(length=50)
     
     rows_html = ""
     if not cached_files:
@@ -784,7 +790,7 @@ async def media_streamer(request: web.Request, chat_id: int, id: int, secure_has
             file_name = f"{secrets.token_hex(2)}.unknown"
 
     # Check if file is cached
-    cached_path = media_cache.get_cached_path(chat_id, id, secure_hash)
+    cached_path = await media_cache.get_cached_path(chat_id, id, secure_hash)
     if cached_path and cached_path.exists():
         logging.info(f"Cache HIT: {file_name}")
         return await stream_from_cache(